@@ -0,0 +1,120 @@
+"""
+Startup-time and throughput benchmark for the gunicorn server modes.
+
+Starts gunicorn with budget_tracker/gunicorn_conf.py once per SERVER_MODE,
+measures the time until the first HTTP response, then hammers one endpoint
+from a pool of keep-alive client threads.
+
+    python bench_server.py --modes gthread asgi --duration 10 --clients 16 \
+        --path /api/dashboard/ --token <api token>
+
+Without --token the request is answered with 401, which still measures the
+server and middleware overhead but not the view itself.
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, path, timeout=60):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', path)
+            conn.getresponse().read()
+            return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'Server did not answer within {timeout}s')
+
+
+def hammer(port, path, headers, duration, clients):
+    counts = [0] * clients
+    errors = [0] * clients
+    latencies = [[] for _ in range(clients)]
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors[index] += 1
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            latencies[index].append(time.perf_counter() - started)
+            counts[index] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_latencies = sorted(value for values in latencies for value in values)
+    p50 = all_latencies[len(all_latencies) // 2] if all_latencies else 0
+    p99 = all_latencies[int(len(all_latencies) * 0.99)] if all_latencies else 0
+    return sum(counts) / duration, sum(errors), p50, p99
+
+
+def run_mode(mode, args):
+    port = free_port()
+    env = dict(os.environ, SERVER_MODE=mode, PORT=str(port))
+    if args.workers:
+        env['WEB_CONCURRENCY'] = str(args.workers)
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'python:budget_tracker.gunicorn_conf',
+               '--access-logfile', '/dev/null']
+
+    started = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port, args.path)
+        startup = time.perf_counter() - started
+        headers = {'Authorization': f'Token {args.token}'} if args.token else {}
+        throughput, errors, p50, p99 = hammer(port, args.path, headers, args.duration, args.clients)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    return startup, throughput, errors, p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['gthread', 'asgi'])
+    parser.add_argument('--path', default='/api/')
+    parser.add_argument('--token', help='API token sent as "Authorization: Token <token>"')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per mode')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent keep-alive clients')
+    parser.add_argument('--workers', type=int, help='Override WEB_CONCURRENCY')
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'startup (s)':>13}{'req/s':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'errors':>8}")
+    for mode in args.modes:
+        startup, throughput, errors, p50, p99 = run_mode(mode, args)
+        print(f'{mode:<10}{startup:>13.2f}{throughput:>10.1f}{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
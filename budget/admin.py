@@ -0,0 +1,121 @@
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import balance, events, heatmap, reports
+from .cache import EXPENSES, bump_versions
+from .duplicates import refresh_fingerprints
+from .models import Budget, Category, Job, Transaction
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that, on PostgreSQL, takes the row count of an unfiltered
+    changelist from the planner's statistics instead of running COUNT(*) over
+    the whole table. Filtered changelists and other databases count exactly.
+    """
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            # reltuples is -1 (or 0) until the table has been analyzed.
+            if row and row[0] >= self.estimate_threshold:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ['user']
+    list_per_page = 50
+
+
+def _bulk_update(modeladmin, request, queryset, message, **values):
+    with transaction.atomic():
+        user_ids = list(queryset.order_by().values_list('user_id', flat=True).distinct())
+        if 'type' in values:
+            years = list(queryset.order_by().values_list('user_id', 'date__year').distinct())
+            refresh_fingerprints(queryset, type=values['type'])
+            # A category of the other type would be left on the row; clear it.
+            values['category'] = Case(
+                When(category__in=Category.objects.filter(type=values['type']), then=F('category')),
+                default=None,
+            )
+        updated = queryset.update(updated_at=timezone.now(), **values)
+        if 'type' in values:
+            balance.rebuild(user_ids)
+        events.publish_refresh(user_ids)
+        for user_id in user_ids:
+            reports.mark_stale(user_id)
+    if 'type' in values:
+        for user_id, year in years:
+            heatmap.bump_years(user_id, [year])
+    bump_versions(user_ids)
+    bump_versions(user_ids, scope=EXPENSES)
+    modeladmin.message_user(request, message % updated, messages.SUCCESS)
+
+
+@admin.register(Category)
+class CategoryAdmin(LargeTableAdmin):
+    list_display = ['name', 'type', 'user', 'created_at']
+    list_filter = ['type']
+    list_select_related = ['user']
+    search_fields = ['name']
+
+
+@admin.register(Transaction)
+class TransactionAdmin(LargeTableAdmin):
+    list_display = ['id', 'date', 'type', 'amount', 'currency', 'category', 'user']
+    list_filter = ['type']
+    list_select_related = ['user', 'category']
+    # Exact lookups only: substring search would scan the whole table.
+    search_fields = ['=id', '=user__username']
+    date_hierarchy = 'date'
+    autocomplete_fields = ['category']
+    actions = ['clear_category', 'mark_income', 'mark_expense']
+
+    @admin.action(description='Clear category of selected transactions')
+    def clear_category(self, request, queryset):
+        _bulk_update(self, request, queryset, '%d transaction(s) uncategorized.', category=None)
+
+    @admin.action(description='Mark selected transactions as income')
+    def mark_income(self, request, queryset):
+        _bulk_update(self, request, queryset, '%d transaction(s) marked as income.', type='income')
+
+    @admin.action(description='Mark selected transactions as expense')
+    def mark_expense(self, request, queryset):
+        _bulk_update(self, request, queryset, '%d transaction(s) marked as expense.', type='expense')
+
+
+@admin.register(Budget)
+class BudgetAdmin(LargeTableAdmin):
+    list_display = ['user', 'month', 'year', 'amount']
+    list_filter = ['year']
+    list_select_related = ['user']
+    search_fields = ['=user__username']
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ['id', 'kind', 'status', 'user', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    list_select_related = ['user']
+    readonly_fields = ['result', 'error', 'attempts', 'started_at', 'finished_at', 'expires_at']
+    actions = ['retry']
+
+    @admin.action(description='Retry selected jobs')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='pending', attempts=0, run_after=timezone.now(), updated_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} job(s) queued again.', messages.SUCCESS)
@@ -0,0 +1,221 @@
+"""
+Vectorized spending analytics.
+
+A user's transactions for a date range are loaded once into parallel NumPy
+arrays (date ordinals, amounts in integer cents, category codes) and every
+statistic is computed from those arrays in whole-array passes, so the cost is
+dominated by fetching the rows rather than by Python loops over them. The
+database hands the rows over as integers and ISO date strings, which
+np.fromiter() packs into a structured array without creating a Decimal or
+date object per row.
+"""
+
+from datetime import date
+
+import numpy as np
+from django.db.models import BigIntegerField, CharField, F, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+from .models import Category, Transaction
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+ROW = np.dtype([('id', np.int64), ('cents', np.int64), ('category', np.int64), ('date', 'datetime64[D]')])
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()  # datetime64[D] counts days from here
+
+
+class Columns:
+    """Columnar view of a user's transactions over [start, end]."""
+
+    def __init__(self, start, end, ids, dates, cents, codes, category_ids):
+        self.start = start
+        self.end = end
+        self.ids = ids                    # int64, transaction ids
+        self.dates = dates                # int32, date ordinals
+        self.cents = cents                # int64, amount in cents
+        self.codes = codes                # int32, index into category_ids
+        self.category_ids = category_ids  # int64, 0 stands for "uncategorized"
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def num_days(self):
+        return self.end.toordinal() - self.start.toordinal() + 1
+
+
+def load_columns(user, start, end, transaction_type='expense'):
+    rows = (
+        Transaction.objects.filter(user=user, type=transaction_type, date__gte=start, date__lte=end)
+        .order_by()
+        .annotate(
+            # Rounded before the cast: SQLite may hold amounts as binary floats.
+            cents=Cast(Round(F('amount') * 100), BigIntegerField()),
+            category_code=Coalesce('category_id', Value(0)),
+            day=Cast('date', CharField()),
+        )
+        .values_list('id', 'cents', 'category_code', 'day')
+    )
+    table = np.fromiter(rows.iterator(chunk_size=10000), dtype=ROW)
+    category_ids, codes = np.unique(table['category'], return_inverse=True)
+
+    return Columns(
+        start,
+        end,
+        np.ascontiguousarray(table['id']),
+        (table['date'].astype(np.int64) + EPOCH_ORDINAL).astype(np.int32),
+        np.ascontiguousarray(table['cents']),
+        codes.astype(np.int32),
+        category_ids,
+    )
+
+
+def _grouped_percentiles(sorted_values, starts, counts, q):
+    """Linear-interpolated percentile `q` of each group in a group-sorted array."""
+    position = starts + q * np.maximum(counts - 1, 0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    fraction = position - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+
+def category_summary(columns):
+    """Count, total, mean, median, p90, stddev and quartiles per category code (in cents)."""
+    groups = len(columns.category_ids)
+    counts = np.bincount(columns.codes, minlength=groups)
+    totals = np.bincount(columns.codes, weights=columns.cents, minlength=groups)
+    squares = np.bincount(columns.codes, weights=columns.cents.astype(np.float64) ** 2, minlength=groups)
+    mean = totals / counts
+    std = np.sqrt(np.maximum(squares / counts - mean ** 2, 0))
+
+    order = np.lexsort((columns.cents, columns.codes))
+    sorted_cents = columns.cents[order].astype(np.float64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    return {
+        'counts': counts,
+        'totals': totals,
+        'mean': mean,
+        'std': std,
+        'q1': _grouped_percentiles(sorted_cents, starts, counts, 0.25),
+        'median': _grouped_percentiles(sorted_cents, starts, counts, 0.5),
+        'q3': _grouped_percentiles(sorted_cents, starts, counts, 0.75),
+        'p90': _grouped_percentiles(sorted_cents, starts, counts, 0.9),
+    }
+
+
+def daily_totals(columns):
+    offsets = columns.dates - columns.start.toordinal()
+    return np.bincount(offsets, weights=columns.cents, minlength=columns.num_days).astype(np.int64)
+
+
+def rolling_sum(values, window):
+    cumulative = np.concatenate(([0], np.cumsum(values)))
+    index = np.arange(1, len(values) + 1)
+    return cumulative[index] - cumulative[np.maximum(index - window, 0)]
+
+
+def weekday_profile(columns):
+    # date.toordinal() is 1 for Monday 0001-01-01, so (ordinal - 1) % 7 == weekday().
+    weekdays = (columns.dates - 1) % 7
+    totals = np.bincount(weekdays, weights=columns.cents, minlength=7)
+    counts = np.bincount(weekdays, minlength=7)
+    all_days = np.arange(columns.start.toordinal(), columns.end.toordinal() + 1)
+    occurrences = np.bincount((all_days - 1) % 7, minlength=7)
+    return totals, counts, occurrences
+
+
+def outliers(columns, summary, method='zscore', threshold=3.0):
+    """Return (row indices, scores) of outlier transactions, highest score first."""
+    if method == 'iqr':
+        q1 = summary['q1'][columns.codes]
+        q3 = summary['q3'][columns.codes]
+        iqr = q3 - q1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(iqr > 0, (columns.cents - q3) / iqr, 0.0)
+        mask = scores > threshold
+    else:
+        mean = summary['mean'][columns.codes]
+        std = summary['std'][columns.codes]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(std > 0, (columns.cents - mean) / std, 0.0)
+        mask = np.abs(scores) > threshold
+    index = np.flatnonzero(mask)
+    index = index[np.argsort(-np.abs(scores[index]), kind='stable')]
+    return index, scores[index]
+
+
+def _money(cents):
+    return round(float(cents) / 100, 2)
+
+
+def spending_analytics(user, start, end, transaction_type='expense', outlier_method='zscore', threshold=3.0, limit=20):
+    columns = load_columns(user, start, end, transaction_type)
+    names = dict(Category.objects.filter(user=user).values_list('id', 'name'))
+
+    response = {
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'type': transaction_type,
+        'count': len(columns),
+        'total': _money(columns.cents.sum()),
+        'categories': [],
+        'daily': {},
+        'weekdays': [],
+        'outliers': [],
+    }
+
+    daily = daily_totals(columns)
+    response['daily'] = {
+        'start_date': start.isoformat(),
+        'totals': (daily / 100).round(2).tolist(),
+        'rolling_7': (rolling_sum(daily, 7) / 100).round(2).tolist(),
+        'rolling_30': (rolling_sum(daily, 30) / 100).round(2).tolist(),
+    }
+
+    totals, counts, occurrences = weekday_profile(columns)
+    response['weekdays'] = [
+        {
+            'day': WEEKDAYS[day],
+            'total': _money(totals[day]),
+            'count': int(counts[day]),
+            'average_per_day': _money(totals[day] / occurrences[day]) if occurrences[day] else 0.0,
+        }
+        for day in range(7)
+    ]
+
+    if not len(columns):
+        return response
+
+    summary = category_summary(columns)
+    for code, category_id in enumerate(columns.category_ids.tolist()):
+        response['categories'].append({
+            'category': category_id or None,
+            'category_name': names.get(category_id, 'Uncategorized'),
+            'count': int(summary['counts'][code]),
+            'total': _money(summary['totals'][code]),
+            'mean': _money(summary['mean'][code]),
+            'median': _money(summary['median'][code]),
+            'p90': _money(summary['p90'][code]),
+            'stddev': _money(summary['std'][code]),
+        })
+    response['categories'].sort(key=lambda row: row['total'], reverse=True)
+
+    index, scores = outliers(columns, summary, outlier_method, threshold)
+    index, scores = index[:limit], scores[:limit]
+    descriptions = dict(
+        Transaction.objects.filter(id__in=columns.ids[index].tolist()).values_list('id', 'description')
+    )
+    for row, score in zip(index.tolist(), scores.tolist()):
+        transaction_id = int(columns.ids[row])
+        category_id = int(columns.category_ids[columns.codes[row]])
+        response['outliers'].append({
+            'id': transaction_id,
+            'date': date.fromordinal(int(columns.dates[row])).isoformat(),
+            'amount': _money(columns.cents[row]),
+            'category': category_id or None,
+            'category_name': names.get(category_id, 'Uncategorized'),
+            'description': descriptions.get(transaction_id, ''),
+            'score': round(score, 2),
+        })
+
+    return response
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class BudgetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'budget'
\ No newline at end of file
+    name = 'budget'
+
+    def ready(self):
+        from . import signals  # noqa: F401
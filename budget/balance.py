@@ -0,0 +1,148 @@
+"""
+Monthly running-balance checkpoints.
+
+BalanceCheckpoint keeps, per user and month, that month's income and expense
+totals and the cumulative balance at the end of the month. Transaction signals
+apply each change incrementally (the changed month plus an F() update of the
+later checkpoints). rebuild() recomputes them from the transactions, for bulk
+changes that bypass signals.
+
+A balance as of any date is the previous month's checkpoint plus a sum over
+the few days of the current month.
+
+Writers lock the user's row first: a new month's checkpoint starts from the
+previous month's balance, and the F() update of later months cannot see a
+checkpoint another transaction has not committed yet, so concurrent changes
+to one user's checkpoints must not interleave.
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import BalanceCheckpoint, Transaction
+
+ZERO = Decimal('0.00')
+MAX_HISTORY_MONTHS = 120
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return date(month.year + 1, 1, 1) if month.month == 12 else date(month.year, month.month + 1, 1)
+
+
+def _lock_users(user_ids):
+    # Ordered, so two writers locking several users cannot deadlock.
+    list(User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def apply_changes(user_id, changes):
+    """Apply Transaction.total_changes() to the user's checkpoints."""
+    months = {}
+    for month, _, kind, amount in changes:
+        income, expenses = months.get(month, (ZERO, ZERO))
+        months[month] = (income + amount, expenses) if kind == 'income' else (income, expenses + amount)
+
+    if not months:
+        return
+    with transaction.atomic():
+        _lock_users([user_id])
+        for month, (income, expenses) in sorted(months.items()):
+            net = income - expenses
+            checkpoints = BalanceCheckpoint.objects.filter(user_id=user_id)
+            values = {
+                'income': F('income') + income,
+                'expenses': F('expenses') + expenses,
+                'balance': F('balance') + net,
+            }
+            if not checkpoints.filter(month=month).update(**values):
+                previous = checkpoints.filter(month__lt=month).order_by('-month').values_list('balance', flat=True).first()
+                try:
+                    with transaction.atomic():
+                        BalanceCheckpoint.objects.create(
+                            user_id=user_id, month=month, income=income, expenses=expenses,
+                            balance=(previous or ZERO) + net,
+                        )
+                except IntegrityError:
+                    # Created concurrently; add to that row instead.
+                    checkpoints.filter(month=month).update(**values)
+            if net:
+                checkpoints.filter(month__gt=month).update(balance=F('balance') + net)
+
+
+def rebuild(user_ids):
+    """Recompute the checkpoints of the given users from their transactions."""
+    with transaction.atomic():
+        _lock_users(user_ids)
+        rows = (
+            Transaction.objects.filter(user_id__in=user_ids)
+            .annotate(month=TruncMonth('date'))
+            .values_list('user_id', 'month')
+            .annotate(
+                income=Sum('amount', filter=Q(type='income')),
+                expenses=Sum('amount', filter=Q(type='expense')),
+            )
+            .order_by('user_id', 'month')
+        )
+        checkpoints = []
+        balances = {}
+        for user_id, month, income, expenses in rows:
+            income, expenses = income or ZERO, expenses or ZERO
+            balances[user_id] = balances.get(user_id, ZERO) + income - expenses
+            checkpoints.append(BalanceCheckpoint(
+                user_id=user_id, month=month, income=income, expenses=expenses, balance=balances[user_id],
+            ))
+        BalanceCheckpoint.objects.filter(user_id__in=user_ids).delete()
+        BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=1000)
+    return len(checkpoints)
+
+
+def balance_at(user, day):
+    """Balance at the end of `day`: the last checkpoint before its month plus the month so far."""
+    start = month_start(day)
+    previous = (
+        BalanceCheckpoint.objects.filter(user=user, month__lt=start)
+        .order_by('-month').values_list('balance', flat=True).first()
+    )
+    totals = Transaction.objects.filter(user=user, date__gte=start, date__lte=day).aggregate(
+        income=Sum('amount', filter=Q(type='income')),
+        expenses=Sum('amount', filter=Q(type='expense')),
+    )
+    return (previous or ZERO) + (totals['income'] or ZERO) - (totals['expenses'] or ZERO)
+
+
+def monthly_history(user, start, end):
+    """Income, expenses and closing balance of every month from `start` to `end` (first days)."""
+    previous = (
+        BalanceCheckpoint.objects.filter(user=user, month__lt=start)
+        .order_by('-month').values_list('balance', flat=True).first()
+    )
+    checkpoints = {
+        checkpoint.month: checkpoint
+        for checkpoint in BalanceCheckpoint.objects.filter(user=user, month__gte=start, month__lte=end)
+    }
+    balance = previous or ZERO
+    months = []
+    month = start
+    while month <= end:
+        checkpoint = checkpoints.get(month)
+        income = checkpoint.income if checkpoint else ZERO
+        expenses = checkpoint.expenses if checkpoint else ZERO
+        if checkpoint:
+            balance = checkpoint.balance
+        months.append({
+            'month': month.strftime('%Y-%m'),
+            'income': income,
+            'expenses': expenses,
+            'net': income - expenses,
+            'balance': balance,
+        })
+        month = next_month(month)
+    return months
@@ -0,0 +1,69 @@
+"""
+Per-user cache helpers.
+
+Cached values are keyed on a per-user version number. Writes bump the version
+instead of deleting keys, so every entry derived from the old data becomes
+unreachable at once and simply ages out of the cache. The version keys live in
+the 'state' cache, away from the results, so culling results never drops them
+(a dropped version only costs a miss: a fresh one is made).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.connection import ConnectionProxy
+
+TRANSACTIONS = 'transactions'
+# Covers the forecast's per-month expense totals; bumped by bulk category changes.
+EXPENSES = 'expenses'
+
+# Version keys and rate-limit buckets (settings.CACHES['state']).
+state_cache = ConnectionProxy(caches, 'state')
+
+
+def _version_key(user_id, scope):
+    return f'budget:version:{scope}:{user_id}'
+
+
+def get_version(user_id, scope=TRANSACTIONS):
+    key = _version_key(user_id, scope)
+    version = state_cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        state_cache.set(key, version, None)
+    return version
+
+
+def get_versions(user_id, scopes):
+    """{scope: version} of several scopes, read with one get_many."""
+    keys = {scope: _version_key(user_id, scope) for scope in scopes}
+    versions = state_cache.get_many(keys.values())
+    missing = {key: time.time_ns() for key in keys.values() if key not in versions}
+    if missing:
+        state_cache.set_many(missing, None)
+        versions.update(missing)
+    return {scope: versions[key] for scope, key in keys.items()}
+
+
+def bump_version(user_id, scope=TRANSACTIONS):
+    state_cache.set(_version_key(user_id, scope), time.time_ns(), None)
+
+
+def bump_versions(user_ids, scope=TRANSACTIONS):
+    stamp = time.time_ns()
+    state_cache.set_many({_version_key(user_id, scope): stamp for user_id in user_ids}, None)
+
+
+def user_cache_key(user_id, name, *parts, scope=TRANSACTIONS):
+    version = get_version(user_id, scope)
+    return ':'.join(['budget', name, str(user_id), str(version)] + [str(part) for part in parts])
+
+
+def cached_for_user(user_id, name, parts, compute, scope=TRANSACTIONS):
+    key = user_cache_key(user_id, name, *parts, scope=scope)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, settings.BUDGET_CACHE_TIMEOUT)
+    return value
@@ -0,0 +1,164 @@
+"""
+Multi-period comparison.
+
+Each metric (income/expense totals, category totals, budgets) is computed for
+all requested periods at once, not with one query per period: daily totals per
+type and category of all the periods' rows are read in one grouped query,
+converted to the user's base currency, and added up per period.
+"""
+
+import calendar
+import re
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from .fx import base_currency, grouped_totals
+from .models import Budget, Transaction
+
+MAX_PERIODS = 12
+MAX_RANGE_DAYS = 366
+
+MONTH = re.compile(r'^(\d{4})-(\d{2})$')
+QUARTER = re.compile(r'^(\d{4})-Q([1-4])$', re.IGNORECASE)
+YEAR = re.compile(r'^(\d{4})$')
+RANGE = re.compile(r'^(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})$')
+
+
+class InvalidPeriod(ValueError):
+    pass
+
+
+def _month_end(year, month):
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def parse_period(token):
+    """
+    Parse one period: '2024-05' (month), '2024-Q2' (quarter), '2024' (year)
+    or '2024-01-01..2024-01-15' (custom range). Returns (label, start, end).
+    """
+    token = token.strip()
+    match = MONTH.match(token) or QUARTER.match(token) or YEAR.match(token) or RANGE.match(token)
+    if not match:
+        raise InvalidPeriod(f'{token}: expected YYYY-MM, YYYY-Qn, YYYY or YYYY-MM-DD..YYYY-MM-DD')
+    try:
+        if match.re is MONTH:
+            year, month = int(match.group(1)), int(match.group(2))
+            return token, date(year, month, 1), _month_end(year, month)
+        if match.re is QUARTER:
+            year, first = int(match.group(1)), 3 * int(match.group(2)) - 2
+            return token.upper(), date(year, first, 1), _month_end(year, first + 2)
+        if match.re is YEAR:
+            return token, date(int(token), 1, 1), date(int(token), 12, 31)
+        start, end = date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))
+    except ValueError as exc:
+        raise InvalidPeriod(f'{token}: {exc}')
+    if start > end:
+        raise InvalidPeriod(f'{token}: start is after end')
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise InvalidPeriod(f'{token}: a range may span at most {MAX_RANGE_DAYS} days')
+    return token, start, end
+
+
+def parse_periods(value):
+    tokens = [token for token in (value or '').split(',') if token.strip()]
+    if not tokens:
+        raise InvalidPeriod('Provide at least one period.')
+    if len(tokens) > MAX_PERIODS:
+        raise InvalidPeriod(f'At most {MAX_PERIODS} periods can be compared.')
+    return [parse_period(token) for token in tokens]
+
+
+def _months(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _money(value):
+    return f'{value or Decimal("0.00"):.2f}'
+
+
+def _delta(current, baseline):
+    difference = current - baseline
+    percent = round(float(difference / baseline * 100), 2) if baseline else None
+    return _money(difference), percent
+
+
+def compare_periods(user, periods):
+    in_period = [Q(date__gte=start, date__lte=end) for _, start, end in periods]
+    # Only the periods' own rows, not everything between the earliest and latest.
+    transactions = Transaction.objects.filter(reduce(or_, in_period), user=user)
+
+    # Daily totals per type and category in the base currency, from one grouped
+    # query (plus one for foreign-currency rows); periods may overlap, so each
+    # day is added to every period containing it.
+    base = base_currency(user)
+    daily, _ = grouped_totals(transactions, ['type', 'category_id', 'category__name', 'date'], base)
+    totals = [{'income': Decimal('0.00'), 'expense': Decimal('0.00')} for _ in periods]
+    category_totals = [defaultdict(Decimal) for _ in periods]
+    for (kind, category_id, name, day), total in daily.items():
+        for i, (_, start, end) in enumerate(periods):
+            if start <= day <= end:
+                totals[i][kind] += total
+                if category_id is not None:
+                    category_totals[i][kind, name, category_id] += total
+    category_keys = sorted({key for period in category_totals for key in period})
+
+    # Budgets of the periods' years in one query; the months are picked below.
+    years = {year for _, start, end in periods for year in range(start.year, end.year + 1)}
+    budgets = {
+        (year, month): amount
+        for year, month, amount in Budget.objects.filter(user=user, year__in=years).values_list('year', 'month', 'amount')
+    }
+
+    results = []
+    sums = []
+    for i, (label, start, end) in enumerate(periods):
+        income = totals[i]['income']
+        expenses = totals[i]['expense']
+        sums.append((income, expenses))
+        months_budgets = [budgets[month] for month in _months(start, end) if month in budgets]
+        results.append({
+            'label': label,
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'income': _money(income),
+            'expenses': _money(expenses),
+            'net': _money(income - expenses),
+            'budget': _money(sum(months_budgets)) if months_budgets else None,
+            'categories': [
+                {
+                    'category': category_id,
+                    'category_name': name,
+                    'type': kind,
+                    'total': _money(category_totals[i][kind, name, category_id]),
+                }
+                for kind, name, category_id in category_keys
+                if category_totals[i].get((kind, name, category_id))
+            ],
+        })
+
+    # Deltas of the first period against each of the others.
+    base_income, base_expenses = sums[0]
+    deltas = []
+    for result, (income, expenses) in zip(results[1:], sums[1:]):
+        income_delta, income_pct = _delta(base_income, income)
+        expenses_delta, expenses_pct = _delta(base_expenses, expenses)
+        deltas.append({
+            'period': results[0]['label'],
+            'compared_to': result['label'],
+            'income': income_delta,
+            'income_pct': income_pct,
+            'expenses': expenses_delta,
+            'expenses_pct': expenses_pct,
+            'net': _money((base_income - base_expenses) - (income - expenses)),
+        })
+
+    return {'currency': base, 'periods': results, 'deltas': deltas}
@@ -0,0 +1,136 @@
+"""
+Duplicate transactions.
+
+Every transaction stores a fingerprint (see models.transaction_fingerprint)
+in an indexed column, so checking a new row against everything already stored
+is one index lookup, and checking a whole import is one `fingerprint IN (...)`
+query plus a set of the batch's own fingerprints.
+"""
+
+from django.db import transaction
+from django.db.models import Count, Min
+
+from . import balance, events, forecast, heatmap, reports
+from .cache import bump_version
+from .fx import CURRENCIES, base_currency, check_currencies
+from .models import Transaction
+from .rules import categorize
+
+BULK_LIMIT = 1000
+
+
+def find_duplicate(user, fingerprint, exclude=None):
+    duplicates = Transaction.objects.filter(user=user, fingerprint=fingerprint)
+    if exclude is not None:
+        duplicates = duplicates.exclude(pk=exclude)
+    return duplicates.values_list('id', flat=True).first()
+
+
+def create_many(user, rows, allow_duplicates=False):
+    """
+    Create transactions from validated `rows` with a single bulk INSERT.
+
+    Rows duplicating a stored transaction or an earlier row of the batch are
+    skipped unless `allow_duplicates`, in which case they are saved as
+    confirmed duplicates that find_duplicates leaves alone. Uncategorized rows go through the
+    user's categorization rules and rows without a currency get the user's
+    base currency. Raises fx.UnknownCurrency (before inserting anything) for a
+    currency that cannot be converted. Returns (created, duplicates) where
+    duplicates is a list of {'index', 'duplicate_of'}.
+    """
+    base = base_currency(user)
+    check_currencies({row.get('currency') or base for row in rows}, base)
+    candidates = []
+    for row in rows:
+        obj = Transaction(
+            user=user, category_id=row.get('category'), type=row['type'], amount=row['amount'],
+            currency=row.get('currency') or base, description=row.get('description', ''), date=row['date'],
+        )
+        if obj.category_id is None:
+            obj.category_id = categorize(user.id, obj.type, obj.description, obj.amount)
+        obj.fingerprint = obj.compute_fingerprint()
+        candidates.append(obj)
+
+    existing = dict(
+        Transaction.objects.filter(user=user, fingerprint__in={obj.fingerprint for obj in candidates})
+        .values_list('fingerprint', 'id')
+    )
+    seen = {}
+    created = []
+    skipped = []
+    for index, obj in enumerate(candidates):
+        if obj.fingerprint in existing or obj.fingerprint in seen:
+            if not allow_duplicates:
+                skipped.append((index, obj.fingerprint))
+                continue
+            obj.confirmed_duplicate = True
+        seen.setdefault(obj.fingerprint, obj)
+        created.append(obj)
+
+    with transaction.atomic():
+        Transaction.objects.bulk_create(created, batch_size=500)
+        # bulk_create sends no signals; apply their effects once for the batch.
+        balance.apply_changes(user.id, [change for obj in created for change in obj.total_changes()])
+        if created:
+            events.publish_refresh([user.id])
+            reports.mark_stale(user.id, {obj.date.year for obj in created})
+    if created:
+        bump_version(user.id)
+        bump_version(user.id, scope=CURRENCIES)
+        heatmap.bump_years(user.id, {obj.date.year for obj in created})
+        forecast.bump_months(user.id, {(obj.date.year, obj.date.month) for obj in created if obj.type == 'expense'})
+
+    duplicates = [
+        {'index': index, 'duplicate_of': existing.get(fingerprint) or seen[fingerprint].pk}
+        for index, fingerprint in skipped
+    ]
+    return created, duplicates
+
+
+def refresh_fingerprints(queryset, batch_size=500, **values):
+    """
+    Store the fingerprints the rows of `queryset` will have once `values` are
+    applied. Call it just before the UPDATE (in the same transaction): the
+    queryset may filter on the fields being changed.
+    """
+    rows = queryset.order_by().select_related(None).only('id', 'user_id', 'type', 'date', 'amount', 'currency', 'description')
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        for field, value in values.items():
+            setattr(row, field, value)
+        row.fingerprint = row.compute_fingerprint()
+        batch.append(row)
+        if len(batch) == batch_size:
+            Transaction.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['fingerprint'])
+
+
+def duplicate_clusters(queryset=None):
+    """
+    (fingerprint, user_id, count, id of the oldest row) of every fingerprint
+    stored more than once, not counting confirmed duplicates.
+    """
+    queryset = Transaction.objects.all() if queryset is None else queryset
+    return list(
+        queryset.filter(confirmed_duplicate=False).order_by()
+        .values_list('fingerprint', 'user_id')
+        .annotate(count=Count('id'), keep=Min('id'))
+        .filter(count__gt=1)
+        .order_by('user_id', 'keep')
+    )
+
+
+def resolve_clusters(clusters, batch_size=500):
+    """
+    Delete all but the oldest row of each cluster, sparing confirmed
+    duplicates; signals keep derived data in step.
+    """
+    deleted = 0
+    for i in range(0, len(clusters), batch_size):
+        batch = clusters[i:i + batch_size]
+        extra = Transaction.objects.filter(
+            fingerprint__in=[fingerprint for fingerprint, _, _, _ in batch], confirmed_duplicate=False
+        ).exclude(id__in=[keep for _, _, _, keep in batch])
+        deleted += extra.delete()[0]
+    return deleted
@@ -0,0 +1,224 @@
+"""
+Live change events for the dashboard (served as server-sent events).
+
+Writes publish a small delta event per user: which month and category totals
+changed and by how much, or a budget's new amount. Connected clients apply the
+delta to what they already show instead of re-fetching the dashboard.
+
+Fan-out happens in-process: each open stream registers an asyncio queue with
+the broker, and publishing hands the event to the queues of that user only.
+With EVENTS_BACKEND = 'postgres' events are sent through NOTIFY instead, and
+every process LISTENs and feeds its own broker, so streams see writes made by
+any web or worker process. The in-process backend only reaches streams served
+by the process that made the write.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+
+# Sent when a change cannot be described as a delta (bulk updates) or a client
+# fell too far behind; the client should re-fetch.
+REFRESH = {'event': 'refresh'}
+
+
+class Broker:
+    def __init__(self):
+        self.subscribers = defaultdict(set)  # user_id -> {(loop, queue)}
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Register a queue for the calling event loop; returns the subscription."""
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE))
+        with self.lock:
+            self.subscribers[user_id].add(subscription)
+        if settings.EVENTS_BACKEND == 'postgres':
+            start_listener()
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscribers[user_id]
+
+    def dispatch(self, user_id, event):
+        """Deliver an event to the user's queues; safe to call from any thread."""
+        with self.lock:
+            subscriptions = list(self.subscribers.get(user_id, ()))
+        for loop, queue in subscriptions:
+            try:
+                loop.call_soon_threadsafe(_put, queue, event)
+            except RuntimeError:
+                # The loop has been closed; its stream is gone.
+                self.unsubscribe(user_id, (loop, queue))
+
+
+def _put(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # A client this far behind is better off re-fetching than replaying.
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(REFRESH)
+
+
+broker = Broker()
+
+
+def publish(user_id, event):
+    if settings.EVENTS_BACKEND == 'postgres':
+        # NOTIFY is transactional: it is delivered on commit, dropped on rollback.
+        payload = json.dumps({'user': user_id, 'event': event})
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [settings.EVENTS_CHANNEL, payload])
+    else:
+        transaction.on_commit(lambda: broker.dispatch(user_id, event))
+
+
+def publish_refresh(user_ids):
+    for user_id in set(user_ids):
+        publish(user_id, REFRESH)
+
+
+def _money(value):
+    return f'{value:.2f}'
+
+
+def transaction_event(instance, action):
+    """Delta event for a saved or deleted transaction."""
+    changes = {}
+    for month, category_id, kind, amount in instance.total_changes(deleted=action == 'deleted'):
+        change = changes.setdefault((month, category_id), {'income': Decimal('0.00'), 'expenses': Decimal('0.00')})
+        change['income' if kind == 'income' else 'expenses'] += amount
+    return {
+        'event': 'transaction',
+        'action': action,
+        'id': instance.pk,
+        'changes': [
+            {
+                'month': month.strftime('%Y-%m'),
+                'category': category_id,
+                'income': _money(change['income']),
+                'expenses': _money(change['expenses']),
+            }
+            for (month, category_id), change in sorted(changes.items(), key=lambda item: (item[0][0], item[0][1] or 0))
+        ],
+    }
+
+
+def budget_event(instance, action):
+    return {
+        'event': 'budget',
+        'action': action,
+        'id': instance.pk,
+        'month': f'{instance.year}-{instance.month:02d}',
+        'amount': None if action == 'deleted' else _money(Decimal(str(instance.amount))),
+    }
+
+
+def cancel_on_disconnect(app, paths):
+    """
+    Wrap an ASGI application so requests for `paths` are cancelled as soon as
+    the client disconnects. Django 4.2 keeps iterating a streaming response
+    after the client has gone (and servers silently drop the writes), which
+    would keep every closed stream and its subscription alive forever.
+    """
+    async def application(scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in paths:
+            return await app(scope, receive, send)
+
+        messages = asyncio.Queue()
+        task = asyncio.ensure_future(app(scope, messages.get, send))
+        while True:
+            receiving = asyncio.ensure_future(receive())
+            done, _ = await asyncio.wait({task, receiving}, return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                receiving.cancel()
+                return task.result()
+            message = receiving.result()
+            if message['type'] == 'http.disconnect':
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                return
+            messages.put_nowait(message)
+
+    return application
+
+
+def format_sse(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+TICKET_SALT = 'budget.events.ticket'
+
+
+def stream_ticket(user):
+    """
+    A signed ticket opening the user's stream for EVENTS_TICKET_MAX_AGE
+    seconds. EventSource cannot send headers, so the ticket goes in the query
+    string, where it may be logged; unlike the API token it soon expires.
+    """
+    return signing.dumps(user.pk, salt=TICKET_SALT)
+
+
+def ticket_user_id(ticket):
+    """The user id of a valid, unexpired ticket, else None."""
+    try:
+        return signing.loads(ticket, salt=TICKET_SALT, max_age=settings.EVENTS_TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener():
+    """Start this process's LISTEN thread (postgres backend) if not running."""
+    global _listener
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, name='budget-events-listener', daemon=True)
+            _listener.start()
+
+
+def _listen():
+    while True:
+        try:
+            # A dedicated autocommit connection; Django's own connections are
+            # per-thread and would hold a transaction open around LISTEN.
+            wrapper = connections['default']
+            raw = wrapper.get_new_connection(wrapper.get_connection_params())
+            raw.autocommit = True
+            try:
+                raw.execute(f'LISTEN {settings.EVENTS_CHANNEL}')
+                for notify in raw.notifies():
+                    try:
+                        message = json.loads(notify.payload)
+                    except ValueError:
+                        continue
+                    broker.dispatch(message['user'], message['event'])
+            finally:
+                raw.close()
+        except Exception:
+            logger.exception('Event listener lost its database connection; reconnecting')
+            time.sleep(5)
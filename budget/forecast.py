@@ -0,0 +1,199 @@
+"""
+End-of-month expense forecast.
+
+Daily expense totals per category are kept as fixed-width (31 day) integer-cent
+arrays per month. Every month is cached under its own version, bumped only by
+writes that change that month's expenses (bulk category changes that do not
+know their months bump EXPENSES, which covers all of them), so a forecast only
+queries the months missing from the cache (normally just the current one).
+Recurring expenses scheduled for the rest of the month are a floor under each
+category's projected remaining spend.
+"""
+
+import calendar
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .cache import EXPENSES, bump_version, get_versions
+from .fx import raw_currency
+from .models import Budget, Category, Transaction
+from .recurring import scheduled_totals
+
+HISTORY_MONTHS = 12
+BAND = (10, 90)  # percentiles of the historical remaining spend
+
+
+def add_months(year, month, delta):
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+
+def month_scope(year, month):
+    return f'{EXPENSES}:{year}-{month:02d}'
+
+
+def bump_months(user_id, months):
+    for year, month in set(months):
+        bump_version(user_id, scope=month_scope(year, month))
+
+
+def changed_months(instance, deleted=False):
+    """(year, month) of the expense totals a save (or delete) of `instance` changes."""
+    return {
+        (month.year, month.month) for month, _, kind, _ in instance.total_changes(deleted=deleted) if kind == 'expense'
+    }
+
+
+def monthly_daily_totals(user, months):
+    """
+    Return {(year, month): {category_id: int64[31]}} of expense cents per day.
+
+    Versions and cached months are read with one get_many each; all missing
+    months are filled from a single grouped query over their combined date span.
+    """
+    versions = get_versions(user.id, [EXPENSES] + [month_scope(*month) for month in months])
+    keys = {
+        month: f'budget:daily-expenses:{user.id}:{versions[EXPENSES]}:{versions[month_scope(*month)]}:{month[0]}:{month[1]}'
+        for month in months
+    }
+    found = cache.get_many(keys.values())
+    result = {month: found[key] for month, key in keys.items() if key in found}
+
+    missing = [month for month in months if month not in result]
+    if missing:
+        first, last = min(missing), max(missing)
+        rows = (
+            Transaction.objects.filter(
+                user=user, type='expense',
+                date__gte=date(*first, 1),
+                date__lte=date(*last, calendar.monthrange(*last)[1]),
+            )
+            .values_list('date', 'category_id')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        )
+        filled = {month: {} for month in missing}
+        for day, category_id, total in rows:
+            series = filled.get((day.year, day.month))
+            if series is None:
+                continue
+            if category_id not in series:
+                series[category_id] = np.zeros(31, dtype=np.int64)
+            series[category_id][day.day - 1] += int(total * 100)
+        cache.set_many({keys[month]: filled[month] for month in missing}, settings.BUDGET_CACHE_TIMEOUT)
+        result.update(filled)
+
+    return result
+
+
+def _stack(months, totals, category_ids):
+    """Build a (months, categories, 31) cube; categories follow `category_ids` order."""
+    cube = np.zeros((len(months), len(category_ids), 31), dtype=np.int64)
+    column = {category_id: i for i, category_id in enumerate(category_ids)}
+    for m, month in enumerate(months):
+        for category_id, series in totals[month].items():
+            cube[m, column[category_id]] = series
+    return cube
+
+
+def forecast_month(user, year, month, today=None):
+    # History sums raw amounts; raises fx.MixedCurrencies for other users.
+    currency = raw_currency(user)
+    today = today or date.today()
+    days_in_month = calendar.monthrange(year, month)[1]
+    if (year, month) < (today.year, today.month):
+        elapsed = days_in_month
+    elif (year, month) > (today.year, today.month):
+        elapsed = 0
+    else:
+        elapsed = today.day
+
+    history = [add_months(year, month, -offset) for offset in range(HISTORY_MONTHS, 0, -1)]
+    totals = monthly_daily_totals(user, history + [(year, month)])
+
+    scheduled = {
+        category_id: int(total * 100)
+        for (kind, category_id), total in scheduled_totals(
+            user, date(year, month, 1), date(year, month, days_in_month), currency
+        ).items()
+        if kind == 'expense'
+    }
+
+    category_ids = sorted(
+        {c for series in totals.values() for c in series} | set(scheduled), key=lambda c: (c is None, c or 0)
+    )
+    current = _stack([(year, month)], totals, category_ids)[0]
+    past = _stack(history, totals, category_ids)
+
+    # Ignore months before the user's first recorded expense.
+    active = np.flatnonzero(past.sum(axis=(1, 2)))
+    past = past[active[0]:] if len(active) else past[:0]
+
+    spent = current[:, :elapsed].sum(axis=1)
+    if len(past):
+        remaining = past[:, :, elapsed:].sum(axis=2)          # (months, categories)
+        expected = remaining.mean(axis=0)
+        low, high = np.percentile(remaining, BAND, axis=0)
+        total_remaining = remaining.sum(axis=1)
+        total_low, total_high = np.percentile(total_remaining, BAND)
+    else:
+        # No history yet: extrapolate this month's daily run rate.
+        rate = spent / elapsed if elapsed else np.zeros(len(category_ids))
+        expected = low = high = rate * (days_in_month - elapsed)
+        total_low = total_high = expected.sum()
+
+    # Scheduled recurring expenses will happen; history can only add to them.
+    fixed = np.array([scheduled.get(c, 0) for c in category_ids], dtype=np.int64)
+    expected, low, high = np.maximum(expected, fixed), np.maximum(low, fixed), np.maximum(high, fixed)
+    total_low, total_high = max(total_low, fixed.sum()), max(total_high, fixed.sum())
+
+    projected = spent + expected
+    projected_total = projected.sum()
+
+    budget = Budget.objects.filter(user=user, year=year, month=month).values_list('amount', flat=True).first()
+    names = dict(Category.objects.filter(user=user, id__in=[c for c in category_ids if c]).values_list('id', 'name'))
+
+    def money(cents):
+        return round(float(cents) / 100, 2)
+
+    categories = [
+        {
+            'category': category_id,
+            'category_name': names.get(category_id, 'Uncategorized'),
+            'spent_to_date': money(spent[i]),
+            'scheduled': money(fixed[i]),
+            'projected_total': money(projected[i]),
+            'low': money(spent[i] + low[i]),
+            'high': money(spent[i] + high[i]),
+        }
+        for i, category_id in enumerate(category_ids)
+        if projected[i] > 0
+    ]
+    categories.sort(key=lambda row: row['projected_total'], reverse=True)
+
+    over_under = money(projected_total) - float(budget) if budget is not None else None
+    return {
+        'year': year,
+        'month': month,
+        'currency': currency,
+        'as_of': today.isoformat(),
+        'days_elapsed': elapsed,
+        'days_in_month': days_in_month,
+        'history_months': len(past),
+        'spent_to_date': money(spent.sum()),
+        'scheduled': money(fixed.sum()),
+        'projected_total': money(projected_total),
+        'confidence': {
+            'level': (BAND[1] - BAND[0]) / 100,
+            'low': money(spent.sum() + total_low),
+            'high': money(spent.sum() + total_high),
+        },
+        'budget': float(budget) if budget is not None else None,
+        'projected_over_under': round(over_under, 2) if over_under is not None else None,
+        'will_exceed_budget': over_under > 0 if over_under is not None else None,
+        'categories': categories,
+    }
@@ -0,0 +1,197 @@
+"""
+Currency conversion at aggregation time.
+
+Amounts are stored in their own currency and converted into the user's base
+currency only when totals are built. grouped_totals() sums in the database per
+group and currency; groups already in the base currency are used as they are
+(the only query for single-currency users), and the rest are summed again per
+(currency, date) and converted one group at a time in Decimal at that date's
+rate. The conversion work grows with the number of distinct days and
+currencies, not with the number of transactions.
+"""
+
+import csv
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .cache import cached_for_user
+from .models import FxRate, RecurringTransaction, Transaction, UserPreferences, YearlySummary
+
+CENT = Decimal('0.01')
+ONE = Decimal('1')
+
+# Cache scope of raw_currency(), bumped by writes that can change its answer.
+CURRENCIES = 'currencies'
+
+
+class MissingRate(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_code = 'missing_rate'
+
+    def __init__(self, currency, day):
+        super().__init__(
+            f'No {currency} exchange rate on or shortly before {day.isoformat()}; load rates with manage.py load_fx_rates.'
+        )
+
+
+class MixedCurrencies(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'mixed_currencies'
+
+    def __init__(self, base):
+        super().__init__(
+            f'This endpoint sums amounts without converting them, so it is only available while all '
+            f'transactions are in your base currency ({base}).'
+        )
+
+
+class UnknownCurrency(ValueError):
+    pass
+
+
+def base_currency(user):
+    return (
+        UserPreferences.objects.filter(user=user).values_list('base_currency', flat=True).first()
+        or settings.DEFAULT_CURRENCY
+    )
+
+
+def user_currencies(user):
+    """Currencies of the user's transactions and recurring templates."""
+    return (
+        set(Transaction.objects.filter(user=user).values_list('currency', flat=True).distinct().order_by())
+        | set(RecurringTransaction.objects.filter(user=user).values_list('currency', flat=True).distinct().order_by())
+    )
+
+
+def check_currencies(currencies, base):
+    """
+    Raise UnknownCurrency unless amounts in every one of `currencies` can be
+    converted into `base`, i.e. both have rates loaded (or are the reference
+    currency). A single-currency user needs no rates and no query.
+    """
+    if not set(currencies) - {base}:
+        return
+    known = set(FxRate.objects.values_list('currency', flat=True).distinct().order_by())
+    known.add(settings.FX_REFERENCE_CURRENCY)
+    for currency in sorted(set(currencies) | {base}):
+        if currency not in known:
+            raise UnknownCurrency(f'No exchange rates are loaded for {currency}; use one of {", ".join(sorted(known))}.')
+
+
+def raw_currency(user):
+    """
+    The currency of endpoints that sum stored amounts without converting them:
+    the base currency, provided every transaction is in it. Raises
+    MixedCurrencies otherwise.
+    """
+    def compute():
+        base = base_currency(user)
+        # Two range conditions rather than `!=`, so the (user, currency) index is used.
+        mixed = Transaction.objects.filter(user=user).filter(Q(currency__lt=base) | Q(currency__gt=base)).exists()
+        return base, mixed
+
+    base, mixed = cached_for_user(user.id, 'raw-currency', [], compute, scope=CURRENCIES)
+    if mixed:
+        raise MixedCurrencies(base)
+    return base
+
+
+class RateTable:
+    """Rates of `currencies` between `start` and `end`, loaded with one query."""
+
+    def __init__(self, currencies, start, end):
+        self.max_age = settings.FX_MAX_RATE_AGE_DAYS
+        self.dates = defaultdict(list)
+        self.rates = defaultdict(list)
+        rows = FxRate.objects.filter(
+            currency__in=set(currencies) - {settings.FX_REFERENCE_CURRENCY},
+            date__gte=start - timedelta(days=self.max_age), date__lte=end,
+        ).order_by('currency', 'date').values_list('currency', 'date', 'rate')
+        for currency, day, rate in rows:
+            self.dates[currency].append(day)
+            self.rates[currency].append(rate)
+
+    def rate(self, currency, day):
+        if currency == settings.FX_REFERENCE_CURRENCY:
+            return ONE
+        dates = self.dates[currency]
+        i = bisect_right(dates, day) - 1
+        if i < 0 or (day - dates[i]).days > self.max_age:
+            raise MissingRate(currency, day)
+        return self.rates[currency][i]
+
+    def convert(self, amount, currency, base, day):
+        if currency == base:
+            return amount
+        return amount / self.rate(currency, day) * self.rate(base, day)
+
+
+def grouped_totals(queryset, fields, base):
+    """
+    Sum of `amount` per distinct `fields` values, in `base` currency.
+    Returns ({key tuple: Decimal}, set of currencies seen).
+    """
+    totals = defaultdict(Decimal)
+    currencies = set()
+    rows = queryset.values_list(*fields, 'currency').annotate(total=Sum('amount')).order_by()
+    for *key, currency, total in rows:
+        currencies.add(currency)
+        if currency == base:
+            totals[tuple(key)] += total
+
+    if currencies - {base}:
+        dated = list(
+            queryset.exclude(currency=base)
+            .values_list(*fields, 'currency', 'date')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        )
+        days = [row[-2] for row in dated]
+        rates = RateTable(currencies | {base}, min(days), max(days))
+        for *key, currency, day, total in dated:
+            totals[tuple(key)] += rates.convert(total, currency, base, day)
+
+    return {key: total.quantize(CENT, ROUND_HALF_UP) for key, total in totals.items()}, currencies
+
+
+def read_rates(path):
+    """Parse a `date,currency,rate` CSV into FxRate objects."""
+    rates = {}
+    with open(path, newline='') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                day = date.fromisoformat(row['date'].strip())
+                currency = row['currency'].strip().upper()
+                rate = Decimal(row['rate'].strip())
+            except (KeyError, AttributeError, ValueError, InvalidOperation):
+                raise ValueError(f'{path}:{line}: expected date,currency,rate')
+            if len(currency) != 3 or not currency.isalpha() or rate <= 0:
+                raise ValueError(f'{path}:{line}: invalid currency or rate')
+            # A later row for the same day replaces an earlier one.
+            rates[currency, day] = FxRate(currency=currency, date=day, rate=rate)
+    return list(rates.values())
+
+
+def load_rates(rates, batch_size=1000):
+    """Insert or update `rates`; reports of the affected years are recomputed on next read."""
+    with transaction.atomic():
+        for i in range(0, len(rates), batch_size):
+            FxRate.objects.bulk_create(
+                rates[i:i + batch_size], batch_size=batch_size,
+                update_conflicts=True, unique_fields=['currency', 'date'], update_fields=['rate'],
+            )
+        if rates:
+            # A rate also stands in for the following FX_MAX_RATE_AGE_DAYS days.
+            first = min(rate.date for rate in rates).year
+            last = (max(rate.date for rate in rates) + timedelta(days=settings.FX_MAX_RATE_AGE_DAYS)).year
+            YearlySummary.objects.filter(year__gte=first, year__lte=last).update(version=F('version') + 1)
+    return len(rates)
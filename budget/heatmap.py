@@ -0,0 +1,85 @@
+"""
+Calendar heatmap: daily income and expense totals of one year.
+
+A year is one GROUP BY (date, type) over the (user, date) index, returned as
+two parallel arrays of integer cents indexed by day of the year, or packed as
+little-endian int64s (income, then expenses) for clients that want bytes.
+
+Each year has its own cache version, bumped only by writes that touch a date
+in that year, so editing this month's transactions leaves earlier years cached.
+"""
+
+import sys
+from array import array
+from datetime import date
+
+from django.db.models import Sum
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .cache import bump_version, cached_for_user
+from .models import Transaction
+
+FIELDS = ('date', 'type', 'amount')
+MIN_YEAR, MAX_YEAR = 1900, 9998
+
+
+def year_scope(year):
+    return f'heatmap:{year}'
+
+
+def bump_years(user_id, years):
+    for year in set(years):
+        bump_version(user_id, scope=year_scope(year))
+
+
+def changed_years(instance, deleted=False):
+    """Years whose daily totals a save (or delete) of `instance` changes."""
+    original = getattr(instance, '_original', None)
+    current = None if deleted else instance._tracked_values()
+    if original and current and all(original[field] == current[field] for field in FIELDS):
+        return set()
+    return {values['date'].year for values in (original, current) if values}
+
+
+def daily_totals(user, year):
+    start = date(year, 1, 1)
+    days = (date(year + 1, 1, 1) - start).days
+    income = [0] * days
+    expenses = [0] * days
+    rows = (
+        Transaction.objects.filter(user=user, date__gte=start, date__lt=date(year + 1, 1, 1))
+        .values_list('date', 'type')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for day, kind, total in rows:
+        column = income if kind == 'income' else expenses
+        column[(day - start).days] = int(total * 100)
+    return {'year': year, 'start': start.isoformat(), 'days': days, 'unit': 'cents',
+            'income': income, 'expenses': expenses}
+
+
+def year_heatmap(user, year):
+    return cached_for_user(user.id, 'heatmap', [year], lambda: daily_totals(user, year), scope=year_scope(year))
+
+
+def pack(heatmap):
+    values = array('q', heatmap['income'] + heatmap['expenses'])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+class BinaryRenderer(BaseRenderer):
+    """Renders bytes as-is (?format=binary); anything else, i.e. errors, as JSON."""
+    media_type = 'application/octet-stream'
+    format = 'binary'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return JSONRenderer().render(data)
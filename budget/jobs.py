@@ -0,0 +1,159 @@
+"""
+Database-backed background jobs.
+
+Jobs are rows in the ``Job`` table. ``manage.py run_jobs`` claims due jobs and
+runs them in a process pool; clients submit jobs and poll for results through
+``/api/jobs/``. Handlers are registered with the ``@job`` decorator and receive
+the owning user plus the job's ``params``; their return value (which must be
+JSON serializable) becomes the job result.
+"""
+
+import csv
+import inspect
+import io
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import reports
+from .models import Job, Transaction
+from .rules import apply_rules
+
+HANDLERS = {}
+
+
+class InvalidParams(ValueError):
+    """Params that do not match the handler's signature; such jobs are not retried."""
+
+
+def job(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def check_params(kind, params):
+    """Raise InvalidParams unless the handler of `kind` accepts `params`."""
+    try:
+        inspect.signature(HANDLERS[kind]).bind(None, **params)
+    except TypeError as exc:
+        raise InvalidParams(f'Invalid params for {kind}: {exc}')
+
+
+def submit(user, kind, params=None, max_attempts=None):
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    check_params(kind, params or {})
+    return Job.objects.create(
+        user=user,
+        kind=kind,
+        params=params or {},
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim(limit):
+    """
+    Mark up to `limit` due jobs as running and return their ids.
+
+    Each job is claimed with a conditional UPDATE, so two workers racing for
+    the same row cannot both win it. This works the same on SQLite and
+    PostgreSQL and needs no broker.
+    """
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status='pending', run_after__lte=now)
+        .order_by('run_after', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    claimed = []
+    for job_id in candidates:
+        won = Job.objects.filter(pk=job_id, status='pending').update(
+            status='running', attempts=F('attempts') + 1, started_at=now, updated_at=now
+        )
+        if won:
+            claimed.append(job_id)
+    return claimed
+
+
+def run(job_id):
+    """Execute a claimed job and record its result, scheduling a retry on failure."""
+    job_obj = Job.objects.select_related('user').get(pk=job_id)
+    try:
+        check_params(job_obj.kind, job_obj.params)
+        handler = HANDLERS[job_obj.kind]
+        result = handler(job_obj.user, **job_obj.params)
+    except Exception as exc:
+        job_obj.error = traceback.format_exc()
+        # Bad params fail the same way on every attempt.
+        if job_obj.attempts < job_obj.max_attempts and not isinstance(exc, InvalidParams):
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job_obj.attempts - 1)
+            job_obj.status = 'pending'
+            job_obj.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            job_obj.status = 'failed'
+            job_obj.finished_at = timezone.now()
+            job_obj.expires_at = job_obj.finished_at + timedelta(seconds=settings.JOB_RESULT_TTL)
+    else:
+        job_obj.status = 'succeeded'
+        job_obj.result = result
+        job_obj.error = ''
+        job_obj.finished_at = timezone.now()
+        job_obj.expires_at = job_obj.finished_at + timedelta(seconds=settings.JOB_RESULT_TTL)
+    job_obj.save()
+    return job_obj.status
+
+
+def requeue_stalled():
+    """
+    Put back jobs whose worker died mid-run. A job that has used up its
+    attempts (e.g. one that keeps getting its worker killed) is failed instead.
+    """
+    now = timezone.now()
+    stalled = Job.objects.filter(status='running', started_at__lt=now - timedelta(seconds=settings.JOB_TIMEOUT))
+    stalled.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', error='The worker stopped while running this job.', finished_at=now,
+        expires_at=now + timedelta(seconds=settings.JOB_RESULT_TTL), updated_at=now,
+    )
+    return stalled.update(status='pending', run_after=now, updated_at=now)
+
+
+def purge_expired():
+    return Job.objects.filter(expires_at__lt=timezone.now()).delete()[0]
+
+
+# Handlers
+
+@job('export_transactions')
+def export_transactions(user, start_date=None, end_date=None, type=None):
+    queryset = Transaction.objects.filter(user=user)
+    if type:
+        queryset = queryset.filter(type=type)
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['date', 'type', 'category', 'amount', 'description'])
+    rows = queryset.values_list('date', 'type', 'category__name', 'amount', 'description')
+    for row_date, row_type, category, amount, description in rows.iterator(chunk_size=2000):
+        writer.writerow([row_date.isoformat(), row_type, category or '', f'{amount:.2f}', description])
+
+    return {'filename': f'transactions-{user.username}.csv', 'content': output.getvalue()}
+
+
+@job('yearly_report')
+def yearly_report(user, year):
+    # The stored annual report, in the user's base currency.
+    return reports.annual_report(user, int(year))
+
+
+@job('apply_rules')
+def apply_category_rules(user):
+    return {'categorized': apply_rules(user)}
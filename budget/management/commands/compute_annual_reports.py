@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from budget import reports
+from budget.models import Transaction
+
+
+class Command(BaseCommand):
+    help = 'Precompute stored annual reports (e.g. ahead of year-end traffic)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, default=date.today().year, help='Report year (default this year)')
+        parser.add_argument('--user', type=int, action='append', dest='users', help='User id (repeatable); default every user with transactions that year')
+
+    def handle(self, *args, **options):
+        year = options['year']
+        user_ids = options['users'] or list(
+            Transaction.objects.filter(date__year=year).order_by().values_list('user_id', flat=True).distinct()
+        )
+        for user in User.objects.filter(id__in=user_ids).iterator():
+            reports.annual_report(user, year)
+        self.stdout.write(f'Computed {year} reports for {len(user_ids)} user(s).')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from budget.duplicates import duplicate_clusters, resolve_clusters
+from budget.models import Transaction
+
+
+class Command(BaseCommand):
+    help = 'List clusters of duplicate transactions (same fingerprint) and optionally delete the extra rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='User id (repeatable); default all users')
+        parser.add_argument('--resolve', action='store_true', help='Keep the oldest row of each cluster and delete the rest')
+
+    def handle(self, *args, **options):
+        queryset = Transaction.objects.all()
+        if options['users']:
+            queryset = queryset.filter(user_id__in=options['users'])
+        clusters = duplicate_clusters(queryset)
+
+        for fingerprint, user_id, count, keep in clusters:
+            self.stdout.write(f'user {user_id}: {count} x transaction #{keep} ({fingerprint[:12]})')
+        extra = sum(count - 1 for _, _, count, _ in clusters)
+        self.stdout.write(f'{len(clusters)} duplicate cluster(s), {extra} extra row(s).')
+
+        if options['resolve'] and clusters:
+            deleted = resolve_clusters(clusters)
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} duplicate transaction(s).'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budget import fx
+
+
+class Command(BaseCommand):
+    help = 'Load daily FX rates from a CSV file with date,currency,rate columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file; rate is units of currency per unit of FX_REFERENCE_CURRENCY')
+
+    def handle(self, *args, **options):
+        try:
+            rates = fx.read_rates(options['path'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f'Loaded {fx.load_rates(rates)} rate(s).')
@@ -0,0 +1,17 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from budget import recurring
+
+
+class Command(BaseCommand):
+    help = 'Create the transactions of recurring transactions that have fallen due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='User id (repeatable); default all users')
+        parser.add_argument('--date', type=date.fromisoformat, help='Materialize up to this date (default today)')
+
+    def handle(self, *args, **options):
+        created, skipped = recurring.materialize_due(today=options['date'], users=options['users'])
+        self.stdout.write(f'Created {created} transaction(s), skipped {skipped} duplicate(s).')
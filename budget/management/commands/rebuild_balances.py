@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from budget import balance
+
+
+class Command(BaseCommand):
+    help = 'Recompute monthly balance checkpoints from transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='User id (repeatable); default all users')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        user_ids = options['users'] or list(User.objects.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+        total = 0
+        for i in range(0, len(user_ids), batch_size):
+            total += balance.rebuild(user_ids[i:i + batch_size])
+        self.stdout.write(f'Rebuilt {total} checkpoint(s) for {len(user_ids)} user(s).')
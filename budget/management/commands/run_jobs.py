@@ -0,0 +1,94 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from budget import jobs, recurring, sync, worker
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.JOB_WORKER_CONCURRENCY,
+            help='Number of worker processes (0 runs jobs inline in this process)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument('--once', action='store_true', help='Process the jobs that are due, then exit')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        poll_interval = options['poll_interval']
+        once = options['once']
+
+        if concurrency <= 0:
+            self.run_inline(poll_interval, once)
+        else:
+            self.run_pool(concurrency, poll_interval, once)
+
+    def housekeeping(self):
+        requeued = jobs.requeue_stalled()
+        purged = jobs.purge_expired()
+        if requeued or purged:
+            self.stdout.write(f'Requeued {requeued} stalled job(s), purged {purged} expired job(s)')
+        pruned = sync.prune_tombstones()
+        if pruned:
+            self.stdout.write(f'Pruned {pruned} expired tombstone(s)')
+        created, _ = recurring.materialize_due()
+        if created:
+            self.stdout.write(f'Materialized {created} recurring transaction(s)')
+
+    def run_inline(self, poll_interval, once):
+        while True:
+            self.housekeeping()
+            claimed = jobs.claim(1)
+            for job_id in claimed:
+                status = jobs.run(job_id)
+                self.stdout.write(f'Job #{job_id}: {status}')
+            if not claimed:
+                if once:
+                    return
+                time.sleep(poll_interval)
+
+    def run_pool(self, concurrency, poll_interval, once):
+        # Spawned (not forked) workers open their own database connections
+        # instead of sharing the parent's socket.
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        in_flight = {}
+        last_housekeeping = 0
+
+        with ProcessPoolExecutor(max_workers=concurrency, mp_context=context, initializer=worker.init) as pool:
+            while True:
+                if time.monotonic() - last_housekeeping > poll_interval * 10:
+                    self.housekeeping()
+                    last_housekeeping = time.monotonic()
+
+                free = concurrency - len(in_flight)
+                claimed = jobs.claim(free) if free else []
+                for job_id in claimed:
+                    in_flight[pool.submit(worker.run, job_id)] = job_id
+
+                if not in_flight:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = in_flight.pop(future)
+                    try:
+                        self.stdout.write(f'Job #{job_id}: {future.result()}')
+                    except Exception as exc:
+                        # The worker process died before it could record the outcome;
+                        # requeue_stalled() will pick the job up again (or fail it
+                        # once its attempts are used up).
+                        self.stderr.write(f'Job #{job_id}: worker error: {exc}')
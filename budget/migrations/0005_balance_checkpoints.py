@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:23
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def build_checkpoints(apps, schema_editor):
+    Transaction = apps.get_model('budget', 'Transaction')
+    BalanceCheckpoint = apps.get_model('budget', 'BalanceCheckpoint')
+    rows = (
+        Transaction.objects.annotate(month=TruncMonth('date'))
+        .values_list('user_id', 'month')
+        .annotate(
+            income=models.Sum('amount', filter=models.Q(type='income')),
+            expenses=models.Sum('amount', filter=models.Q(type='expense')),
+        )
+        .order_by('user_id', 'month')
+    )
+    checkpoints = []
+    balances = {}
+    for user_id, month, income, expenses in rows.iterator():
+        income, expenses = income or Decimal('0.00'), expenses or Decimal('0.00')
+        balances[user_id] = balances.get(user_id, Decimal('0.00')) + income - expenses
+        checkpoints.append(BalanceCheckpoint(
+            user_id=user_id, month=month, income=income, expenses=expenses, balance=balances[user_id],
+        ))
+    BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('budget', '0004_transaction_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('income', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('expenses', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['month'],
+                'unique_together': {('user', 'month')},
+            },
+        ),
+        migrations.RunPython(build_checkpoints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:33
+
+from django.db import migrations, models
+
+from budget.models import transaction_fingerprint
+
+
+def fill_fingerprints(apps, schema_editor):
+    Transaction = apps.get_model('budget', 'Transaction')
+    rows = Transaction.objects.order_by().only('id', 'user_id', 'type', 'date', 'amount', 'description')
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        row.fingerprint = transaction_fingerprint(row.user_id, row.type, row.date, row.amount, row.description)
+        batch.append(row)
+        if len(batch) == 2000:
+            Transaction.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0006_category_rules'),
+    ]
+
+    operations = [
+        # Added without the index, which 0008 builds once after the backfill.
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
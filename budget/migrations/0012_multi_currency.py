@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:51
+
+import budget.models
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+from budget.models import transaction_fingerprint
+
+
+def refill_fingerprints(apps, schema_editor):
+    # Fingerprints now include the currency.
+    Transaction = apps.get_model('budget', 'Transaction')
+    rows = Transaction.objects.order_by().only('id', 'user_id', 'type', 'date', 'amount', 'currency', 'description')
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        row.fingerprint = transaction_fingerprint(
+            row.user_id, row.type, row.date, row.amount, row.description, row.currency
+        )
+        batch.append(row)
+        if len(batch) == 2000:
+            Transaction.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('budget', '0011_yearly_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='currency',
+            field=models.CharField(default=budget.models.default_currency, max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Enter a three-letter ISO 4217 currency code, e.g. USD.')]),
+        ),
+        migrations.RunPython(refill_fingerprints, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='UserPreferences',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_currency', models.CharField(default=budget.models.default_currency, max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Enter a three-letter ISO 4217 currency code, e.g. USD.')])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='preferences', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User preferences',
+            },
+        ),
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Enter a three-letter ISO 4217 currency code, e.g. USD.')])),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=20)),
+            ],
+            options={
+                'ordering': ['currency', 'date'],
+                'unique_together': {('currency', 'date')},
+            },
+        ),
+    ]
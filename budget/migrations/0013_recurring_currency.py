@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:42
+
+import budget.models
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def base_currency_templates(apps, schema_editor):
+    # Scheduled amounts were treated as the owner's base currency.
+    RecurringTransaction = apps.get_model('budget', 'RecurringTransaction')
+    UserPreferences = apps.get_model('budget', 'UserPreferences')
+    RecurringTransaction.objects.filter(user__preferences__isnull=False).update(
+        currency=Subquery(UserPreferences.objects.filter(user=OuterRef('user')).values('base_currency')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0012_multi_currency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='currency',
+            field=models.CharField(default=budget.models.default_currency, max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Enter a three-letter ISO 4217 currency code, e.g. USD.')]),
+        ),
+        migrations.RunPython(base_currency_templates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'currency'], name='budget_tran_user_id_e04873_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0013_recurring_currency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='confirmed_duplicate',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
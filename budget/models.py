@@ -1,7 +1,36 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.core.validators import MinValueValidator
+from django.conf import settings
+from django.core.validators import MinValueValidator, RegexValidator
+from django.utils import timezone
 from decimal import Decimal
+from datetime import date
+import hashlib
+import re
+
+from .schedule import build as build_schedule
+
+
+currency_validator = RegexValidator(r'^[A-Z]{3}$', 'Enter a three-letter ISO 4217 currency code, e.g. USD.')
+
+
+def default_currency():
+    return settings.DEFAULT_CURRENCY
+
+
+def normalize_description(text):
+    """Case-folded words of a description, ignoring punctuation and spacing."""
+    return ' '.join(re.sub(r'[\W_]+', ' ', (text or '').casefold()).split())
+
+
+def transaction_fingerprint(user_id, type, day, amount, description, currency=None):
+    """Hash identifying likely duplicates: same user, type, date, amount, currency and description."""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    currency = currency or settings.DEFAULT_CURRENCY
+    value = f'{user_id}|{type}|{day.isoformat()}|{Decimal(str(amount)):.2f}|{currency}|{normalize_description(description)}'
+    return hashlib.sha256(value.encode()).hexdigest()
+
 
 class Category(models.Model):
     CATEGORY_TYPES = [
@@ -19,6 +48,9 @@ class Category(models.Model):
         verbose_name_plural = 'Categories'
         unique_together = ['user', 'name', 'type']
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.type})"
@@ -34,16 +66,73 @@ class Transaction(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='transactions')
     type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
     amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    currency = models.CharField(max_length=3, default=default_currency, validators=[currency_validator])
     description = models.TextField(blank=True)
     date = models.DateField()
+    fingerprint = models.CharField(max_length=64, db_index=True, editable=False, blank=True)
+    # Saved with allow_duplicate(s): a repeat the user meant, never resolved away.
+    confirmed_duplicate = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+            models.Index(fields=['user', 'date']),
+            models.Index(fields=['date']),
+            models.Index(fields=['user', 'currency']),
+        ]
+    
+    # Fields whose previous values are remembered, so a save or delete can
+    # report what it changed in the monthly totals.
+    TRACKED_FIELDS = ['category_id', 'type', 'amount', 'date', 'currency']
     
     def __str__(self):
         return f"{self.type} - {self.amount} on {self.date}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(name in field_names for name in cls.TRACKED_FIELDS):
+            instance._original = instance._tracked_values()
+        return instance
+    
+    def save(self, *args, **kwargs):
+        self.fingerprint = self.compute_fingerprint()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'fingerprint'}
+        super().save(*args, **kwargs)
+        self._original = self._tracked_values()
+    
+    def compute_fingerprint(self):
+        return transaction_fingerprint(self.user_id, self.type, self.date, self.amount, self.description, self.currency)
+    
+    def _tracked_values(self):
+        values = {name: getattr(self, name) for name in self.TRACKED_FIELDS}
+        if isinstance(values['date'], str):
+            values['date'] = date.fromisoformat(values['date'])
+        values['amount'] = Decimal(str(values['amount']))
+        return values
+    
+    def total_changes(self, deleted=False):
+        """
+        Changes this save (or delete) makes to the per-month totals, as a list
+        of (first day of month, category_id, type, signed amount). Must be
+        called before save() returns, i.e. from a post_save/post_delete handler.
+        """
+        changes = {}
+        
+        def add(values, sign):
+            key = (values['date'].replace(day=1), values['category_id'], values['type'])
+            changes[key] = changes.get(key, Decimal('0.00')) + sign * values['amount']
+        
+        original = getattr(self, '_original', None)
+        if original:
+            add(original, -1)
+        if not deleted:
+            add(self._tracked_values(), 1)
+        return [(month, category_id, kind, amount) for (month, category_id, kind), amount in changes.items() if amount]
 
 
 class Budget(models.Model):
@@ -57,6 +146,203 @@ class Budget(models.Model):
     class Meta:
         unique_together = ['user', 'month', 'year']
         ordering = ['-year', '-month']
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"Budget for {self.month}/{self.year} - {self.amount}"
+
+class Tombstone(models.Model):
+    """Record of a deleted row, so offline clients can drop it on their next sync."""
+    MODEL_CHOICES = [
+        ('category', 'Category'),
+        ('transaction', 'Transaction'),
+        ('budget', 'Budget'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tombstones')
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['user', 'deleted_at']),
+        ]
+    
+    def __str__(self):
+        return f"Deleted {self.model} #{self.object_id}"
+
+
+class CategoryRule(models.Model):
+    """Assigns `category` to uncategorized transactions that match."""
+    KIND_CHOICES = [
+        ('contains', 'Description contains'),
+        ('regex', 'Description matches regex'),
+        ('amount', 'Amount in range'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_rules')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='rules')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    pattern = models.CharField(max_length=200, blank=True)
+    min_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    max_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    priority = models.PositiveIntegerField(default=100)  # lower runs first
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['priority', 'id']
+    
+    def __str__(self):
+        return f"{self.kind} {self.pattern!r} -> {self.category.name}"
+
+
+class RecurringTransaction(models.Model):
+    """
+    A transaction that repeats on a schedule. Its occurrences are virtual until
+    they fall due, when materialize_due() turns them into transactions.
+    """
+    FREQUENCY_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('custom', 'Custom rule'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_transactions')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='recurring_transactions')
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    currency = models.CharField(max_length=3, default=default_currency, validators=[currency_validator])
+    description = models.TextField(blank=True)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES)
+    interval = models.PositiveIntegerField(default=1)  # every N days/weeks/months
+    rule = models.CharField(max_length=200, blank=True)  # RRULE subset, for 'custom'
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    # Occurrences up to this date have been materialized as transactions.
+    materialized_through = models.DateField(null=True, blank=True, editable=False)
+    # First occurrence not materialized yet; None once the schedule has ended.
+    next_date = models.DateField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['start_date', 'id']
+        indexes = [
+            models.Index(fields=['next_date']),
+            models.Index(fields=['user', 'next_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.frequency} {self.type} - {self.amount} from {self.start_date}"
+    
+    def schedule(self):
+        return build_schedule(self.frequency, self.interval, self.rule, self.start_date, self.end_date)
+    
+    def save(self, *args, **kwargs):
+        schedule = self.schedule()
+        if self.materialized_through:
+            self.next_date = schedule.first_after(self.materialized_through)
+        else:
+            self.next_date = next(schedule.between(self.start_date), None)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'next_date'}
+        super().save(*args, **kwargs)
+
+
+class BalanceCheckpoint(models.Model):
+    """A user's income and expenses in one month, and the running balance at its end."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    month = models.DateField()  # first day of the month
+    income = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    expenses = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    
+    class Meta:
+        ordering = ['month']
+        unique_together = ['user', 'month']
+    
+    def __str__(self):
+        return f"Balance {self.balance} at end of {self.month:%Y-%m}"
+
+
+class YearlySummary(models.Model):
+    """A stored annual report; current while computed_version equals version."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='yearly_summaries')
+    year = models.IntegerField()
+    data = models.JSONField(default=dict)
+    version = models.PositiveIntegerField(default=0)  # bumped by writes touching the year
+    computed_version = models.PositiveIntegerField(null=True, blank=True)
+    computed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name_plural = 'Yearly summaries'
+        ordering = ['-year']
+        unique_together = ['user', 'year']
+    
+    def __str__(self):
+        return f"Summary of {self.year}"
+
+
+class UserPreferences(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='preferences')
+    base_currency = models.CharField(max_length=3, default=default_currency, validators=[currency_validator])
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'User preferences'
+    
+    def __str__(self):
+        return f"Preferences of {self.user}"
+
+
+class FxRate(models.Model):
+    """Units of `currency` per one unit of settings.FX_REFERENCE_CURRENCY on `date`."""
+    currency = models.CharField(max_length=3, validators=[currency_validator])
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+    
+    class Meta:
+        ordering = ['currency', 'date']
+        unique_together = ['currency', 'date']
+    
+    def __str__(self):
+        return f"{self.currency} {self.rate} on {self.date}"
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
     
     def __str__(self):
-        return f"Budget for {self.month}/{self.year} - {self.amount}"
\ No newline at end of file
+        return f"{self.kind} job #{self.pk} ({self.status})"
@@ -0,0 +1,181 @@
+"""
+On-demand request profiling for staff.
+
+With PROFILING_ENABLED set, a staff user can add ``?profile=1`` or an
+``X-Profile: 1`` header to any request. The request is then run under a
+profiler (pyinstrument's sampling profiler when installed, cProfile
+otherwise) with its SQL captured, and the result is written to PROFILING_DIR.
+Only the newest PROFILING_MAX_PROFILES profiles are kept. Staff can list and
+download them from /api/profiles/.
+"""
+
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import re
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+PROFILE_ID = re.compile(r'^\d{14}-[0-9a-f]{8}$')
+SQL_LITERAL = re.compile(r"'(?:[^']|'')*'")
+SECRET_TABLES = ('authtoken_token',)
+
+
+def profile_dir():
+    path = Path(settings.PROFILING_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _files(profile_id):
+    return sorted(profile_dir().glob(f'{profile_id}.*'))
+
+
+def list_profiles():
+    profiles = []
+    for meta_path in sorted(profile_dir().glob('*.json'), reverse=True):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta.pop('queries', None)
+        meta.pop('summary', None)
+        profiles.append(meta)
+    return profiles
+
+
+def load_profile(profile_id):
+    if not PROFILE_ID.match(profile_id):
+        return None
+    meta_path = profile_dir() / f'{profile_id}.json'
+    if not meta_path.exists():
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def profile_data_path(profile_id):
+    meta = load_profile(profile_id)
+    if meta is None:
+        return None
+    return profile_dir() / meta['data_file']
+
+
+def _trim():
+    """Keep only the newest PROFILING_MAX_PROFILES profiles (ids sort by time)."""
+    metas = sorted(profile_dir().glob('*.json'))
+    for meta_path in metas[:max(len(metas) - settings.PROFILING_MAX_PROFILES, 0)]:
+        for path in _files(meta_path.stem):
+            path.unlink(missing_ok=True)
+
+
+def redact_queries(queries):
+    """Blank the string literals of queries on SECRET_TABLES (the token lookup carries the key)."""
+    return [
+        dict(query, sql=SQL_LITERAL.sub("'[redacted]'", query['sql']))
+        if any(table in query['sql'] for table in SECRET_TABLES) else query
+        for query in queries
+    ]
+
+
+def save_profile(meta, data, extension):
+    profile_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    directory = profile_dir()
+    data_file = f'{profile_id}.{extension}'
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    with open(directory / data_file, mode) as f:
+        f.write(data)
+    meta = dict(meta, id=profile_id, data_file=data_file)
+    with open(directory / f'{profile_id}.json', 'w') as f:
+        json.dump(meta, f, indent=1)
+    _trim()
+    return profile_id
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = request.GET.get('profile') == '1' or request.META.get('HTTP_X_PROFILE') == '1'
+        if not requested or not self.is_staff(request):
+            return self.get_response(request)
+
+        if SamplingProfiler is not None:
+            profiler, name = SamplingProfiler(), 'pyinstrument'
+        else:
+            profiler, name = cProfile.Profile(), 'cprofile'
+
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            if name == 'pyinstrument':
+                profiler.start()
+            else:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if name == 'pyinstrument':
+                    profiler.stop()
+                else:
+                    profiler.disable()
+        duration = time.perf_counter() - started
+
+        if name == 'pyinstrument':
+            summary = profiler.output_text()
+            data, extension = profiler.output_html(), 'html'
+        else:
+            stream = io.StringIO()
+            stats = pstats.Stats(profiler, stream=stream)
+            stats.sort_stats('cumulative').print_stats(40)
+            summary = stream.getvalue()
+            data, extension = self.dump_stats(profiler), 'prof'
+
+        meta = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'user': request.user.get_username(),
+            'profiler': name,
+            'duration_ms': round(duration * 1000, 2),
+            'query_count': len(queries.captured_queries),
+            'query_time_ms': round(sum(float(q['time']) for q in queries.captured_queries) * 1000, 2),
+            'queries': redact_queries(queries.captured_queries),
+            'summary': summary,
+        }
+        response['X-Profile-Id'] = save_profile(meta, data, extension)
+        return response
+
+    def is_staff(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        # API clients authenticate with a token, which DRF only checks inside
+        # the view; resolve it here so the decision is made before profiling.
+        try:
+            result = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return bool(result and result[0].is_staff)
+
+    @staticmethod
+    def dump_stats(profiler):
+        # Same format as cProfile.Profile.dump_stats(), readable by pstats/snakeviz.
+        profiler.create_stats()
+        return marshal.dumps(profiler.stats)
@@ -0,0 +1,132 @@
+"""
+Recurring transactions.
+
+Templates are never expanded into future rows. Reads that cover a date range
+(transaction list, dashboard, forecast) expand the user's templates on the fly
+into virtual occurrences, from each template's `next_date` on, so nothing that
+is already a transaction is counted twice. materialize_due() turns occurrences
+that have fallen due into real transactions with one bulk insert per user and
+moves the templates' `next_date` past them.
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import groupby
+from operator import attrgetter
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import duplicates
+from .fx import CENT, RateTable
+from .models import RecurringTransaction
+
+MAX_RANGE_DAYS = 366
+
+
+def due_templates(user, start, end):
+    """The user's templates with occurrences not yet materialized between `start` and `end`."""
+    return (
+        RecurringTransaction.objects.filter(user=user, next_date__isnull=False, next_date__lte=end)
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=start))
+        .select_related('category')
+    )
+
+
+def expand(templates, start, end):
+    """(template, date) of every virtual occurrence between `start` and `end`, by date."""
+    occurrences = [
+        (template, day)
+        for template in templates
+        for day in template.schedule().between(max(start, template.next_date), end)
+    ]
+    occurrences.sort(key=lambda item: (item[1], item[0].pk))
+    return occurrences
+
+
+def upcoming(user, start, end, type=None, category=None):
+    """Virtual occurrences between `start` and `end`, shaped like transactions."""
+    templates = due_templates(user, start, end)
+    if type:
+        templates = templates.filter(type=type)
+    if category:
+        templates = templates.filter(category_id=category)
+    return [
+        {
+            'recurring': template.pk,
+            'date': day.isoformat(),
+            'type': template.type,
+            'amount': f'{template.amount:.2f}',
+            'currency': template.currency,
+            'category': template.category_id,
+            'category_name': template.category.name if template.category else None,
+            'description': template.description,
+        }
+        for template, day in expand(templates, start, end)
+    ]
+
+
+def scheduled_totals(user, start, end, base):
+    """
+    {(type, category_id): total in `base` currency} of the virtual occurrences
+    between `start` and `end`. Occurrences after today convert at today's rate.
+    """
+    occurrences = expand(due_templates(user, start, end), start, end)
+    today = date.today()
+    foreign = [(template, min(day, today)) for template, day in occurrences if template.currency != base]
+    if foreign:
+        days = [day for _, day in foreign]
+        rates = RateTable({template.currency for template, _ in foreign} | {base}, min(days), max(days))
+
+    totals = defaultdict(Decimal)
+    for template, day in occurrences:
+        amount = template.amount
+        if template.currency != base:
+            amount = rates.convert(amount, template.currency, base, min(day, today))
+        totals[template.type, template.category_id] += amount
+    return {key: total.quantize(CENT, ROUND_HALF_UP) for key, total in totals.items()}
+
+
+def materialize_due(today=None, users=None):
+    """
+    Create the transactions of every occurrence up to `today` (optionally only
+    for `users`). Occurrences duplicating a transaction the user entered by
+    hand are skipped. Returns (created, skipped).
+    """
+    today = today or date.today()
+    due = RecurringTransaction.objects.filter(next_date__lte=today).select_related('user').order_by('user_id', 'id')
+    if users is not None:
+        due = due.filter(user__in=users)
+
+    created = skipped = 0
+    for _, templates in groupby(due, key=attrgetter('user_id')):
+        templates = list(templates)
+        with transaction.atomic():
+            rows = []
+            for template in templates:
+                schedule = template.schedule()
+                # Claim the occurrences; a concurrent run that moved next_date first wins.
+                claimed = RecurringTransaction.objects.filter(pk=template.pk, next_date=template.next_date).update(
+                    materialized_through=today, next_date=schedule.first_after(today), updated_at=timezone.now()
+                )
+                if not claimed:
+                    continue
+                rows.extend(
+                    {
+                        'category': template.category_id, 'type': template.type, 'amount': template.amount,
+                        'currency': template.currency, 'description': template.description, 'date': day,
+                    }
+                    for day in schedule.between(template.next_date, today)
+                )
+            new, repeated = duplicates.create_many(templates[0].user, rows)
+        created += len(new)
+        skipped += len(repeated)
+    return created, skipped
+
+
+def default_range(start, end):
+    """Fill in a missing range as today and the 30 days after it."""
+    start = start or date.today()
+    return start, end or start + timedelta(days=30)
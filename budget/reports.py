@@ -0,0 +1,200 @@
+"""
+Annual (year-in-review) reports.
+
+Each (user, year) report is computed once and stored in a YearlySummary row.
+Writes that can change a year's report bump that row's `version` with a
+single UPDATE; the report is recomputed on the next read only if `version`
+moved past `computed_version`, so reading an unchanged year is one row fetch
+and a change in one year never recomputes the others.
+"""
+
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import ExtractMonth
+from django.utils import timezone
+
+from .fx import CENT, ONE, RateTable, base_currency, grouped_totals
+from .models import Budget, Transaction, YearlySummary
+
+ZERO = Decimal('0.00')
+LARGEST = 5
+
+
+def mark_stale(user_id, years=None):
+    """Invalidate the user's reports for `years` (all years if None)."""
+    summaries = YearlySummary.objects.filter(user_id=user_id)
+    if years is not None:
+        years = set(years)
+        if not years:
+            return
+        summaries = summaries.filter(year__in=years)
+    summaries.update(version=F('version') + 1)
+
+
+def _money(value):
+    return f'{value or ZERO:.2f}'
+
+
+def _rate(saved, income):
+    return round(float(saved / income * 100), 2) if income else None
+
+
+def _largest(transactions, currencies, base):
+    """
+    The LARGEST rows of `transactions` by amount in `base` currency.
+
+    Each row converts at its own day's rate, so a currency's largest raw
+    amounts are not necessarily its largest converted ones. The top rows of
+    each currency give a threshold; a row left out can only beat it if its
+    amount times the currency's highest conversion factor that year does, so
+    exactly those rows are fetched as well.
+    """
+    fields = ('id', 'date', 'amount', 'currency', 'description', 'category__name')
+    foreign = sorted(currencies - {base})
+    factors = defaultdict(list)
+    if foreign:
+        days = list(transactions.filter(currency__in=foreign).values_list('currency', 'date').distinct().order_by())
+        if days:
+            rates = RateTable(currencies | {base}, min(day for _, day in days), max(day for _, day in days))
+            for currency, day in days:
+                factors[currency].append(rates.convert(ONE, currency, base, day))
+
+    def converted(row):
+        if row['currency'] == base:
+            return row['amount']
+        return rates.convert(row['amount'], row['currency'], base, row['date']).quantize(CENT, ROUND_HALF_UP)
+
+    rows = []
+    complete = set()  # currencies whose rows were all fetched
+    for currency in sorted(currencies):
+        fetched = list(transactions.filter(currency=currency).order_by('-amount', 'date', 'id').values(*fields)[:LARGEST])
+        if len(fetched) < LARGEST:
+            complete.add(currency)
+        rows.extend(fetched)
+    for row in rows:
+        row['converted'] = converted(row)
+    rows.sort(key=lambda row: (-row['converted'], row['date'], row['id']))
+
+    if len(rows) > LARGEST and foreign:
+        # Anything that could round up to the threshold is a candidate.
+        threshold = rows[LARGEST - 1]['converted'] - CENT
+        seen = [row['id'] for row in rows]
+        for currency in foreign:
+            if currency in complete or currency not in factors:
+                continue
+            extra = list(
+                transactions.filter(currency=currency, amount__gte=threshold / max(factors[currency]))
+                .exclude(id__in=seen).values(*fields)
+            )
+            for row in extra:
+                row['converted'] = converted(row)
+            rows.extend(extra)
+        rows.sort(key=lambda row: (-row['converted'], row['date'], row['id']))
+
+    return [
+        {
+            'id': row['id'],
+            'date': row['date'].isoformat(),
+            'amount': _money(row['converted']),
+            'original_amount': _money(row['amount']),
+            'currency': row['currency'],
+            'description': row['description'],
+            'category_name': row['category__name'],
+        }
+        for row in rows[:LARGEST]
+    ]
+
+
+def compute(user, year):
+    transactions = Transaction.objects.filter(user=user, date__year=year)
+    base = base_currency(user)
+
+    # Totals, months and categories all come from one grouped query (plus one
+    # per-day query for foreign-currency rows), converted to the base currency.
+    totals, currencies = grouped_totals(
+        transactions.annotate(month=ExtractMonth('date')), ['type', 'category_id', 'category__name', 'month'], base
+    )
+    months = {month: {'income': ZERO, 'expenses': ZERO} for month in range(1, 13)}
+    categories = {}
+    for (kind, category_id, name, month), total in totals.items():
+        key = 'income' if kind == 'income' else 'expenses'
+        months[month][key] += total
+        category = categories.setdefault((kind, category_id), {
+            'category': category_id,
+            'category_name': name or 'Uncategorized',
+            'type': kind,
+            'total': ZERO,
+            'months': [ZERO] * 12,
+        })
+        category['total'] += total
+        category['months'][month - 1] += total
+
+    budgets = dict(Budget.objects.filter(user=user, year=year).values_list('month', 'amount'))
+    income = sum((month['income'] for month in months.values()), ZERO)
+    expenses = sum((month['expenses'] for month in months.values()), ZERO)
+    budgeted = [month for month in months if month in budgets]
+    budget_total = sum((budgets[month] for month in budgeted), ZERO)
+    budgeted_expenses = sum((months[month]['expenses'] for month in budgeted), ZERO)
+
+    largest = {kind: _largest(transactions.filter(type=kind), currencies, base) for kind in ('income', 'expense')}
+
+    return {
+        'year': year,
+        'currency': base,
+        'transaction_count': transactions.count(),
+        'income': _money(income),
+        'expenses': _money(expenses),
+        'net': _money(income - expenses),
+        'savings_rate': _rate(income - expenses, income),
+        'budget': {
+            'months_budgeted': len(budgeted),
+            'total': _money(budget_total),
+            'spent': _money(budgeted_expenses),
+            'remaining': _money(budget_total - budgeted_expenses),
+            'months_within_budget': sum(1 for month in budgeted if months[month]['expenses'] <= budgets[month]),
+        },
+        'months': [
+            {
+                'month': month,
+                'income': _money(totals['income']),
+                'expenses': _money(totals['expenses']),
+                'net': _money(totals['income'] - totals['expenses']),
+                'savings_rate': _rate(totals['income'] - totals['expenses'], totals['income']),
+                'budget': _money(budgets[month]) if month in budgets else None,
+                'within_budget': totals['expenses'] <= budgets[month] if month in budgets else None,
+            }
+            for month, totals in months.items()
+        ],
+        'categories': [
+            dict(category, total=_money(category['total']), months=[_money(value) for value in category['months']])
+            for category in sorted(categories.values(), key=lambda c: (c['type'], -c['total'], c['category_name']))
+        ],
+        'largest_expenses': largest['expense'],
+        'largest_income': largest['income'],
+    }
+
+
+def annual_report(user, year):
+    """The stored report of `year`, recomputed first if a write has made it stale."""
+    summary = YearlySummary.objects.filter(user=user, year=year).first()
+    if summary is not None and summary.computed_version == summary.version:
+        return summary.data
+
+    if summary is None:
+        # Create the row before computing, so writes made meanwhile bump its
+        # version and the result below is not stored as current.
+        try:
+            with transaction.atomic():
+                summary = YearlySummary.objects.create(user=user, year=year)
+        except IntegrityError:
+            summary = YearlySummary.objects.get(user=user, year=year)
+
+    version = summary.version
+    data = compute(user, year)
+    YearlySummary.objects.filter(pk=summary.pk, version=version).update(
+        data=data, computed_version=version, computed_at=timezone.now()
+    )
+    return data
@@ -0,0 +1,204 @@
+"""
+Rule-based auto-categorization.
+
+A user's rules for one transaction type are compiled into a Matcher. All
+substring ("contains") rules become a single regex built from a prefix trie of
+their lowercased patterns, wrapped in a lookahead so one findall() reports the
+longest pattern starting at every position of the description. Each pattern
+maps to the rules whose pattern is a prefix of it, which recovers every
+matching substring rule in one C-level pass; the cost barely grows with the
+number of rules (a combined alternation or per-rule loop grows linearly).
+Regex and amount rules are checked afterwards, in priority order, only while
+they could still beat the best substring match.
+
+User regexes run inside request threads, so validate_regex() only accepts
+patterns without catastrophic backtracking: short, no backreferences, no
+repetition or alternation nested inside a repetition, and at most
+MAX_REGEX_REPEATS open-ended repetitions. They are searched in the first
+REGEX_TEXT_LIMIT characters of a description, which bounds the polynomial
+cost the remaining repetitions can have.
+
+Compiled matchers are memoized per process, keyed on the user's rules cache
+version, so they are rebuilt only after the rules change.
+"""
+
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import events, reports
+from .cache import EXPENSES, bump_version, get_version
+from .models import CategoryRule, Transaction
+
+RULES = 'rules'  # cache version scope
+UPDATE_BATCH = 1000
+MAX_REGEX_LENGTH = 100
+MAX_REGEX_REPEATS = 2
+REGEX_TEXT_LIMIT = 256
+
+REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)}
+BACKREFERENCES = {sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS}
+
+
+def _check_shape(items, repeated, repeats):
+    """Walk a parsed pattern; return the number of open-ended repetitions seen so far."""
+    for op, av in items:
+        if op in BACKREFERENCES:
+            raise ValueError('Backreferences are not allowed in rule regexes.')
+        if op in REPEATS:
+            low, high, body = av
+            variable = high > low
+            if repeated and variable:
+                raise ValueError('Nested repetition (e.g. (a+)+) is not allowed in rule regexes.')
+            if variable and high > 1:
+                repeats += 1
+            repeats = _check_shape(body, repeated or (variable and high > 1), repeats)
+        elif op == sre_parse.BRANCH:
+            if repeated:
+                raise ValueError('Alternation inside a repetition (e.g. (a|ab)+) is not allowed in rule regexes.')
+            for branch in av[1]:
+                repeats = _check_shape(branch, repeated, repeats)
+        elif op == sre_parse.SUBPATTERN:
+            repeats = _check_shape(av[-1], repeated, repeats)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            repeats = _check_shape(av[1], repeated, repeats)
+    return repeats
+
+
+def validate_regex(pattern):
+    """Raise ValueError unless `pattern` compiles as a rule regex that cannot backtrack catastrophically."""
+    if len(pattern) > MAX_REGEX_LENGTH:
+        raise ValueError(f'Regular expressions may be at most {MAX_REGEX_LENGTH} characters long.')
+    try:
+        re.compile(pattern, re.IGNORECASE)
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except re.error as exc:
+        raise ValueError(f'Invalid regular expression: {exc}')
+    if _check_shape(parsed, False, 0) > MAX_REGEX_REPEATS:
+        raise ValueError(f'Rule regexes may contain at most {MAX_REGEX_REPEATS} open-ended repetitions (*, +, {{n,}}).')
+
+
+def trie_regex(words):
+    """Regex matching any of `words`, as a prefix trie (no backtracking over alternatives)."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy: the longest word at each position wins; shorter ones are its prefixes.
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class Matcher:
+    def __init__(self, rules):
+        """`rules`: (category_id, kind, pattern, min_amount, max_amount) in priority order."""
+        self.rules = rules
+        literals = defaultdict(list)
+        self.others = []
+        for i, (_, kind, pattern, _, _) in enumerate(rules):
+            if kind == 'contains':
+                literals[pattern.lower()].append(i)
+            elif kind == 'regex':
+                try:
+                    validate_regex(pattern)
+                except ValueError:
+                    continue  # saved before patterns were checked this strictly; never matches
+                self.others.append((i, re.compile(pattern, re.IGNORECASE)))
+            else:
+                self.others.append((i, None))
+        # Rule indices matched whenever a literal matches: those of all its prefixes.
+        self.hits = {
+            literal: sorted(i for prefix, indices in literals.items() if literal.startswith(prefix) for i in indices)
+            for literal in literals
+        }
+        self.literals = re.compile(f'(?=({trie_regex(literals)}))') if literals else None
+
+    def _amount_matches(self, index, amount):
+        _, _, _, low, high = self.rules[index]
+        return (low is None or amount >= low) and (high is None or amount <= high)
+
+    def match(self, description, amount):
+        """Category id of the highest-priority rule matching, or None."""
+        description = description or ''
+        best = None
+        if self.literals is not None:
+            found = self.literals.findall(description.lower())
+            if found:
+                candidates = sorted({i for literal in found for i in self.hits[literal]})
+                best = next((i for i in candidates if self._amount_matches(i, amount)), None)
+        for i, regex in self.others:
+            if best is not None and i > best:
+                break
+            if self._amount_matches(i, amount) and (regex is None or regex.search(description[:REGEX_TEXT_LIMIT])):
+                best = i
+                break
+        return self.rules[best][0] if best is not None else None
+
+
+@lru_cache(maxsize=512)
+def _compile(user_id, transaction_type, version):
+    rules = (
+        CategoryRule.objects.filter(user_id=user_id, category__type=transaction_type)
+        .order_by('priority', 'id')
+        .values_list('category_id', 'kind', 'pattern', 'min_amount', 'max_amount')
+    )
+    return Matcher(list(rules))
+
+
+def matcher_for(user_id, transaction_type):
+    return _compile(user_id, transaction_type, get_version(user_id, RULES))
+
+
+def categorize(user_id, transaction_type, description, amount):
+    return matcher_for(user_id, transaction_type).match(description, amount)
+
+
+def apply_rules(user, queryset=None):
+    """
+    Categorize the user's uncategorized transactions (optionally narrowed by
+    `queryset`) with one UPDATE per category and batch. Returns the count.
+    """
+    queryset = Transaction.objects.filter(user=user) if queryset is None else queryset
+    matchers = {kind: matcher_for(user.id, kind) for kind, _ in Transaction.TRANSACTION_TYPES}
+    if not any(matcher.rules for matcher in matchers.values()):
+        return 0
+
+    assigned = defaultdict(list)
+    rows = queryset.filter(category__isnull=True).values_list('id', 'type', 'description', 'amount')
+    for pk, kind, description, amount in rows.iterator(chunk_size=2000):
+        category_id = matchers[kind].match(description, amount)
+        if category_id is not None:
+            assigned[category_id].append(pk)
+
+    updated = 0
+    now = timezone.now()
+    with transaction.atomic():
+        for category_id, ids in assigned.items():
+            for i in range(0, len(ids), UPDATE_BATCH):
+                updated += Transaction.objects.filter(id__in=ids[i:i + UPDATE_BATCH], category__isnull=True).update(
+                    category_id=category_id, updated_at=now
+                )
+        if updated:
+            events.publish_refresh([user.id])
+            reports.mark_stale(user.id)
+    if updated:
+        bump_version(user.id)
+        bump_version(user.id, scope=EXPENSES)
+    return updated
@@ -0,0 +1,141 @@
+"""
+Repeating schedules for recurring transactions.
+
+A schedule repeats every `interval` days, weeks, months or years from its
+anchor date, optionally on several weekdays (weekly) or days of the month
+(monthly; negative days count from the end, and days past the end of a short
+month fall on its last day). Custom schedules are written as a subset of
+iCalendar RRULE, e.g. 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH' or
+'FREQ=MONTHLY;BYMONTHDAY=1,-1'.
+
+Occurrences are generated lazily from the period containing the requested
+start, so expanding a range costs the same however long ago the anchor is.
+"""
+
+import calendar
+from datetime import timedelta
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+
+class InvalidRule(ValueError):
+    pass
+
+
+def _ceil_to(value, step):
+    return max(0, -(-value // step) * step)
+
+
+def _clamp(year, month, day):
+    last = calendar.monthrange(year, month)[1]
+    if day < 0:
+        day = last + 1 + day
+    return min(max(day, 1), last)
+
+
+class Schedule:
+    def __init__(self, freq, anchor, interval=1, weekdays=None, monthdays=None, until=None):
+        self.freq = freq
+        self.anchor = anchor
+        self.interval = interval
+        self.weekdays = sorted(set(weekdays or [anchor.weekday()]))
+        self.monthdays = monthdays or [anchor.day]
+        self.until = until
+
+    def _periods(self, start):
+        """Lists of candidate dates per period, starting with the period containing `start`."""
+        n = self.interval
+        if self.freq == 'daily':
+            k = _ceil_to((start - self.anchor).days, n)
+            while True:
+                yield [self.anchor + timedelta(days=k)]
+                k += n
+        elif self.freq == 'weekly':
+            monday = self.anchor - timedelta(days=self.anchor.weekday())
+            week = _ceil_to((start - monday).days // 7, n)
+            while True:
+                first = monday + timedelta(weeks=week)
+                yield [first + timedelta(days=weekday) for weekday in self.weekdays]
+                week += n
+        else:
+            step = n * 12 if self.freq == 'yearly' else n
+            base = self.anchor.year * 12 + self.anchor.month - 1
+            offset = _ceil_to(start.year * 12 + start.month - 1 - base, step)
+            while True:
+                year, month = divmod(base + offset, 12)
+                month += 1
+                if self.freq == 'yearly':
+                    days = [_clamp(year, month, self.anchor.day)]
+                else:
+                    days = sorted({_clamp(year, month, day) for day in self.monthdays})
+                yield [self.anchor.replace(year=year, month=month, day=day) for day in days]
+                offset += step
+
+    def between(self, start, end=None):
+        """Occurrences from `start` to `end` (inclusive; open-ended if None), in order."""
+        start = max(start, self.anchor)
+        last = min(filter(None, [end, self.until]), default=None)
+        if last is not None and last < start:
+            return
+        for period in self._periods(start):
+            for day in period:
+                if day < start:
+                    continue
+                if last is not None and day > last:
+                    return
+                yield day
+
+    def first_after(self, day):
+        """The first occurrence after `day`, or None if the schedule has ended."""
+        return next(self.between(day + timedelta(days=1)), None)
+
+
+def parse_rule(rule):
+    """Parse an RRULE subset into (freq, interval, weekdays, monthdays)."""
+    parts = {}
+    for part in (rule or '').upper().replace(' ', '').strip(';').split(';'):
+        key, sep, value = part.partition('=')
+        if not sep or not value:
+            raise InvalidRule(f'Expected KEY=VALUE, got {part!r}.')
+        parts[key] = value
+
+    unknown = set(parts) - {'FREQ', 'INTERVAL', 'BYDAY', 'BYMONTHDAY'}
+    if unknown:
+        raise InvalidRule(f'Unsupported rule part(s): {", ".join(sorted(unknown))}.')
+    freq = parts.get('FREQ', '').lower()
+    if freq not in FREQUENCIES:
+        raise InvalidRule('FREQ must be DAILY, WEEKLY, MONTHLY or YEARLY.')
+    try:
+        interval = int(parts.get('INTERVAL', 1))
+    except ValueError:
+        raise InvalidRule('INTERVAL must be an integer.')
+    if not 1 <= interval <= 366:
+        raise InvalidRule('INTERVAL must be between 1 and 366.')
+
+    weekdays = monthdays = None
+    if 'BYDAY' in parts:
+        if freq != 'weekly':
+            raise InvalidRule('BYDAY is only supported with FREQ=WEEKLY.')
+        try:
+            weekdays = [WEEKDAYS.index(day) for day in parts['BYDAY'].split(',')]
+        except ValueError:
+            raise InvalidRule('BYDAY takes MO, TU, WE, TH, FR, SA or SU.')
+    if 'BYMONTHDAY' in parts:
+        if freq != 'monthly':
+            raise InvalidRule('BYMONTHDAY is only supported with FREQ=MONTHLY.')
+        try:
+            monthdays = [int(day) for day in parts['BYMONTHDAY'].split(',')]
+        except ValueError:
+            raise InvalidRule('BYMONTHDAY takes days of the month.')
+        if any(day == 0 or not -31 <= day <= 31 for day in monthdays):
+            raise InvalidRule('BYMONTHDAY days must be 1 to 31 or -31 to -1.')
+    return freq, interval, weekdays, monthdays
+
+
+def build(frequency, interval, rule, start_date, end_date=None):
+    """The Schedule of a recurring transaction; `rule` is used when frequency is 'custom'."""
+    if frequency == 'custom':
+        freq, interval, weekdays, monthdays = parse_rule(rule)
+        return Schedule(freq, start_date, interval, weekdays, monthdays, until=end_date)
+    return Schedule(frequency, start_date, interval or 1, until=end_date)
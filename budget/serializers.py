@@ -1,7 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Category, Transaction, Budget
-from datetime import datetime
+from .models import (
+    Category, CategoryRule, RecurringTransaction, Transaction, Budget, Job, UserPreferences, transaction_fingerprint
+)
+from .duplicates import find_duplicate
+from .fx import UnknownCurrency, base_currency, check_currencies, user_currencies
+from .jobs import HANDLERS, InvalidParams, check_params, submit
+from .rules import categorize, validate_regex
+from .schedule import InvalidRule, parse_rule
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,6 +17,33 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
 
+class UserPreferencesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserPreferences
+        fields = ['base_currency', 'updated_at']
+        read_only_fields = ['updated_at']
+    
+    def validate_base_currency(self, value):
+        try:
+            check_currencies(user_currencies(self.instance.user), value)
+        except UnknownCurrency as exc:
+            raise serializers.ValidationError(str(exc))
+        return value
+
+
+def _validate_currency(serializer, data):
+    """Default a new row's currency to the user's base currency and check a new or changed one."""
+    instance = serializer.instance
+    if instance is not None and data.get('currency', instance.currency) == instance.currency:
+        return
+    base = base_currency(serializer.context['request'].user)
+    data.setdefault('currency', base)
+    try:
+        check_currencies([data['currency']], base)
+    except UnknownCurrency as exc:
+        raise serializers.ValidationError({'currency': str(exc)})
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -20,12 +55,40 @@ class CategorySerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class CategoryStatsSerializer(CategorySerializer):
+    transaction_count = serializers.SerializerMethodField()
+    total_amount = serializers.SerializerMethodField()
+    last_used = serializers.SerializerMethodField()
+    currency = serializers.SerializerMethodField()
+    
+    class Meta(CategorySerializer.Meta):
+        fields = CategorySerializer.Meta.fields + ['transaction_count', 'total_amount', 'currency', 'last_used']
+    
+    def _stats(self, obj):
+        return self.context.get('stats', {}).get(obj.id, {})
+    
+    def get_transaction_count(self, obj):
+        return self._stats(obj).get('transaction_count', 0)
+    
+    def get_total_amount(self, obj):
+        total = self._stats(obj).get('total_amount') or Decimal('0.00')
+        return f'{total:.2f}'
+    
+    def get_currency(self, obj):
+        return self.context.get('currency')
+    
+    def get_last_used(self, obj):
+        last_used = self._stats(obj).get('last_used')
+        return last_used.isoformat() if last_used else None
+
+
 class TransactionSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
+    allow_duplicate = serializers.BooleanField(write_only=True, required=False, default=False)
     
     class Meta:
         model = Transaction
-        fields = ['id', 'category', 'category_name', 'type', 'amount', 'description', 'date', 'created_at', 'updated_at']
+        fields = ['id', 'category', 'category_name', 'type', 'amount', 'currency', 'description', 'date', 'allow_duplicate', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
     
     def validate_category(self, value):
@@ -33,6 +96,136 @@ class TransactionSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Invalid category.")
         return value
     
+    def validate(self, data):
+        _validate_currency(self, data)
+        allow_duplicate = data.pop('allow_duplicate', False)
+        if allow_duplicate:
+            data['confirmed_duplicate'] = True
+            return data
+        
+        # Reject likely duplicates (e.g. a retried request) unless allow_duplicate is set
+        user = self.context['request'].user
+        values = {
+            field: data.get(field, getattr(self.instance, field, '')) for field in ('type', 'date', 'amount', 'description', 'currency')
+        }
+        fingerprint = transaction_fingerprint(
+            user.id, values['type'], values['date'], values['amount'], values['description'], values['currency']
+        )
+        if self.instance is not None and fingerprint == self.instance.fingerprint:
+            return data
+        duplicate = find_duplicate(user, fingerprint, exclude=getattr(self.instance, 'pk', None))
+        if duplicate is not None:
+            raise serializers.ValidationError({
+                'duplicate_of': duplicate,
+                'detail': 'A transaction with the same type, date, amount, currency and description exists. '
+                          'Send allow_duplicate=true to save it anyway.',
+            }, code='duplicate')
+        return data
+    
+    def create(self, validated_data):
+        validated_data['user'] = self.context['request'].user
+        if validated_data.get('category') is None:
+            # Auto-categorize with the user's rules
+            category_id = categorize(
+                validated_data['user'].id, validated_data['type'],
+                validated_data.get('description', ''), validated_data['amount']
+            )
+            if category_id is not None:
+                validated_data.pop('category', None)
+                validated_data['category_id'] = category_id
+        return super().create(validated_data)
+
+
+class BulkTransactionSerializer(serializers.ModelSerializer):
+    # A plain id, checked for all rows at once by the view.
+    category = serializers.IntegerField(required=False, allow_null=True)
+    
+    class Meta:
+        model = Transaction
+        fields = ['category', 'type', 'amount', 'currency', 'description', 'date']
+
+
+class CategoryRuleSerializer(serializers.ModelSerializer):
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    
+    class Meta:
+        model = CategoryRule
+        fields = ['id', 'category', 'category_name', 'kind', 'pattern', 'min_amount', 'max_amount', 'priority', 'created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at']
+    
+    def validate_category(self, value):
+        if value.user != self.context['request'].user:
+            raise serializers.ValidationError("Invalid category.")
+        return value
+    
+    def validate(self, data):
+        kind = data.get('kind', getattr(self.instance, 'kind', None))
+        pattern = data.get('pattern', getattr(self.instance, 'pattern', ''))
+        min_amount = data.get('min_amount', getattr(self.instance, 'min_amount', None))
+        max_amount = data.get('max_amount', getattr(self.instance, 'max_amount', None))
+        
+        if kind in ('contains', 'regex') and not pattern:
+            raise serializers.ValidationError({'pattern': 'This rule needs a pattern.'})
+        if kind == 'regex':
+            try:
+                validate_regex(pattern)
+            except ValueError as exc:
+                raise serializers.ValidationError({'pattern': str(exc)})
+        if kind == 'amount' and min_amount is None and max_amount is None:
+            raise serializers.ValidationError("Amount rules need min_amount and/or max_amount.")
+        if min_amount is not None and max_amount is not None and min_amount > max_amount:
+            raise serializers.ValidationError("min_amount must not exceed max_amount.")
+        return data
+    
+    def create(self, validated_data):
+        validated_data['user'] = self.context['request'].user
+        return super().create(validated_data)
+
+
+class RecurringTransactionSerializer(serializers.ModelSerializer):
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    
+    class Meta:
+        model = RecurringTransaction
+        fields = [
+            'id', 'category', 'category_name', 'type', 'amount', 'currency', 'description', 'frequency', 'interval', 'rule',
+            'start_date', 'end_date', 'next_date', 'materialized_through', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['next_date', 'materialized_through', 'created_at', 'updated_at']
+    
+    def validate_category(self, value):
+        if value and value.user != self.context['request'].user:
+            raise serializers.ValidationError("Invalid category.")
+        return value
+    
+    def validate_interval(self, value):
+        if value < 1 or value > 366:
+            raise serializers.ValidationError("Interval must be between 1 and 366.")
+        return value
+    
+    def validate_start_date(self, value):
+        # Past occurrences are materialized on save; keep the catch-up bounded.
+        if value < date.today() - timedelta(days=366 * 10):
+            raise serializers.ValidationError("start_date may be at most 10 years in the past.")
+        return value
+    
+    def validate(self, data):
+        values = {
+            field: data.get(field, getattr(self.instance, field, None))
+            for field in ('category', 'type', 'frequency', 'rule', 'start_date', 'end_date')
+        }
+        if values['category'] and values['category'].type != values['type']:
+            raise serializers.ValidationError({'category': "Category type must match the transaction type."})
+        if values['end_date'] and values['end_date'] < values['start_date']:
+            raise serializers.ValidationError({'end_date': "end_date must not be before start_date."})
+        if values['frequency'] == 'custom':
+            try:
+                parse_rule(values['rule'])
+            except InvalidRule as exc:
+                raise serializers.ValidationError({'rule': str(exc)})
+        _validate_currency(self, data)
+        return data
+    
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
@@ -62,7 +255,41 @@ class BudgetSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'params', 'status', 'result', 'error', 'attempts', 'created_at', 'started_at', 'finished_at', 'expires_at']
+        read_only_fields = ['status', 'result', 'error', 'attempts', 'created_at', 'started_at', 'finished_at', 'expires_at']
+    
+    def validate_kind(self, value):
+        if value not in HANDLERS:
+            raise serializers.ValidationError(f"Unknown job kind. Choose one of: {', '.join(sorted(HANDLERS))}")
+        return value
+    
+    def validate_params(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Params must be an object.")
+        return value
+    
+    def validate(self, data):
+        try:
+            check_params(data['kind'], data.get('params') or {})
+        except InvalidParams as exc:
+            raise serializers.ValidationError({'params': str(exc)})
+        return data
+    
+    def create(self, validated_data):
+        return submit(self.context['request'].user, validated_data['kind'], validated_data.get('params'))
+
+
+class JobListSerializer(JobSerializer):
+    """Jobs without their result, which can be a whole export; retrieve a job to get it."""
+    class Meta(JobSerializer.Meta):
+        fields = [field for field in JobSerializer.Meta.fields if field != 'result']
+
+
 class DashboardSerializer(serializers.Serializer):
+    currency = serializers.CharField()
     total_income = serializers.DecimalField(max_digits=12, decimal_places=2)
     total_expenses = serializers.DecimalField(max_digits=12, decimal_places=2)
     balance = serializers.DecimalField(max_digits=12, decimal_places=2)
@@ -71,4 +298,7 @@ class DashboardSerializer(serializers.Serializer):
     budget_percentage = serializers.FloatField(allow_null=True)
     income_by_category = serializers.ListField()
     expenses_by_category = serializers.ListField()
-    monthly_trend = serializers.ListField()
\ No newline at end of file
+    monthly_trend = serializers.ListField()
+    scheduled_income = serializers.DecimalField(max_digits=12, decimal_places=2)
+    scheduled_expenses = serializers.DecimalField(max_digits=12, decimal_places=2)
+    upcoming = serializers.ListField()
\ No newline at end of file
@@ -0,0 +1,179 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import balance, events, forecast, fx, heatmap, reports
+from .cache import EXPENSES, bump_version
+from .models import Budget, Category, CategoryRule, RecurringTransaction, Tombstone, Transaction, UserPreferences
+from .rules import RULES
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+def transaction_changed(sender, instance, **kwargs):
+    bump_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=CategoryRule)
+@receiver([post_save, post_delete], sender=Category)
+def rules_changed(sender, instance, **kwargs):
+    # Category changes matter too: rules only match their category's type.
+    bump_version(instance.user_id, scope=RULES)
+
+
+def _deleting_user(origin):
+    if isinstance(origin, QuerySet):
+        return origin.model is User
+    return isinstance(origin, User)
+
+
+@receiver(post_save, sender=Transaction)
+def update_balance_on_save(sender, instance, **kwargs):
+    balance.apply_changes(instance.user_id, instance.total_changes())
+
+
+@receiver(post_delete, sender=Transaction)
+def update_balance_on_delete(sender, instance, origin=None, **kwargs):
+    # The user's checkpoints are deleted along with the user.
+    if _deleting_user(origin):
+        return
+    balance.apply_changes(instance.user_id, instance.total_changes(deleted=True))
+
+
+@receiver(post_save, sender=Transaction)
+def heatmap_saved(sender, instance, **kwargs):
+    heatmap.bump_years(instance.user_id, heatmap.changed_years(instance))
+
+
+@receiver(post_delete, sender=Transaction)
+def heatmap_deleted(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin):
+        return
+    heatmap.bump_years(instance.user_id, heatmap.changed_years(instance, deleted=True))
+
+
+@receiver(post_save, sender=Transaction)
+def expenses_saved(sender, instance, **kwargs):
+    forecast.bump_months(instance.user_id, forecast.changed_months(instance))
+
+
+@receiver(post_delete, sender=Transaction)
+def expenses_deleted(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin):
+        return
+    forecast.bump_months(instance.user_id, forecast.changed_months(instance, deleted=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted_expenses(sender, instance, origin=None, **kwargs):
+    # Its transactions are uncategorized by an UPDATE that sends no signals.
+    if _deleting_user(origin):
+        return
+    bump_version(instance.user_id, scope=EXPENSES)
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+def transaction_report_stale(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin):
+        return
+    original = getattr(instance, '_original', None)
+    years = {instance._tracked_values()['date'].year}
+    if original:
+        years.add(original['date'].year)
+    reports.mark_stale(instance.user_id, years)
+
+
+@receiver(post_save, sender=Budget)
+def budget_saved_report_stale(sender, instance, created, **kwargs):
+    # An update may have moved the budget to another year.
+    reports.mark_stale(instance.user_id, [instance.year] if created else None)
+
+
+@receiver(post_delete, sender=Budget)
+def budget_deleted_report_stale(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin):
+        return
+    reports.mark_stale(instance.user_id, [instance.year])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_report_stale(sender, instance, origin=None, **kwargs):
+    # Category names appear in every year's report.
+    if _deleting_user(origin):
+        return
+    reports.mark_stale(instance.user_id)
+
+
+@receiver(post_save, sender=UserPreferences)
+def preferences_report_stale(sender, instance, **kwargs):
+    # Reports are in the base currency.
+    reports.mark_stale(instance.user_id)
+    bump_version(instance.user_id, scope=fx.CURRENCIES)
+
+
+@receiver(post_save, sender=Transaction)
+def currencies_saved(sender, instance, created, **kwargs):
+    original = getattr(instance, '_original', None)
+    if created or original is None or original['currency'] != instance.currency:
+        bump_version(instance.user_id, scope=fx.CURRENCIES)
+
+
+@receiver(post_delete, sender=Transaction)
+def currencies_deleted(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin):
+        return
+    bump_version(instance.user_id, scope=fx.CURRENCIES)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Budget)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    # Rows removed together with their user need no tombstone (and the
+    # tombstone's own user foreign key would be left dangling).
+    if _deleting_user(origin):
+        return
+    Tombstone.objects.create(user_id=instance.user_id, model=sender._meta.model_name, object_id=instance.pk)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Budget)
+def publish_saved(sender, instance, created, **kwargs):
+    action = 'created' if created else 'updated'
+    if sender is Transaction:
+        events.publish(instance.user_id, events.transaction_event(instance, action))
+    else:
+        events.publish(instance.user_id, events.budget_event(instance, action))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Budget)
+def publish_deleted(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin):
+        return
+    if sender is Transaction:
+        events.publish(instance.user_id, events.transaction_event(instance, 'deleted'))
+    elif sender is Budget:
+        events.publish(instance.user_id, events.budget_event(instance, 'deleted'))
+    else:
+        # Its transactions become uncategorized without any signal.
+        events.publish(instance.user_id, events.REFRESH)
+
+
+@receiver([post_save, post_delete], sender=RecurringTransaction)
+def publish_recurring_changed(sender, instance, origin=None, **kwargs):
+    # Its virtual occurrences show on the dashboard.
+    if _deleting_user(origin):
+        return
+    events.publish(instance.user_id, events.REFRESH)
+
+
+@receiver(pre_delete, sender=Category)
+def touch_category_transactions(sender, instance, origin=None, **kwargs):
+    # Deleting a category sets its transactions' category to NULL without
+    # touching updated_at; bump it so delta sync picks up the change.
+    if _deleting_user(origin):
+        return
+    Transaction.objects.filter(category=instance).update(updated_at=timezone.now())
@@ -0,0 +1,25 @@
+from django.db.models import Count, Max, Sum
+
+from .cache import cached_for_user
+from .models import Transaction
+
+
+def category_stats(user, start_date=None, end_date=None):
+    """
+    Transaction count, total amount and last-used date per category, computed
+    in a single grouped query and cached until the user's transactions change.
+    """
+    def compute():
+        queryset = Transaction.objects.filter(user=user, category__isnull=False)
+        if start_date:
+            queryset = queryset.filter(date__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(date__lte=end_date)
+        rows = (
+            queryset.values('category')
+            .annotate(transaction_count=Count('id'), total_amount=Sum('amount'), last_used=Max('date'))
+            .order_by()
+        )
+        return {row.pop('category'): row for row in rows}
+
+    return cached_for_user(user.id, 'category-stats', [start_date, end_date], compute)
@@ -0,0 +1,116 @@
+"""
+Delta sync for offline clients.
+
+Every stream (categories, transactions, budgets, tombstones) is read in
+(updated_at, id) order from a per-stream cursor. The cursors are packed into a
+signed, opaque watermark: clients send back the watermark from their previous
+response and receive only what changed since. A client without a watermark
+gets everything through the same paged code path.
+
+`updated_at` is stamped when a row is saved, not when its transaction commits,
+so a row may become visible after rows stamped later. Rows from the last
+SYNC_SAFETY_MARGIN seconds are therefore held back until the next sync, and no
+cursor moves into that window. Tombstones are kept SYNC_TOMBSTONE_RETENTION_DAYS;
+an older watermark may have missed deletions and needs a full resync.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Budget, Category, Tombstone, Transaction
+from .serializers import BudgetSerializer, CategorySerializer, TransactionSerializer
+
+SALT = 'budget.sync'
+
+STREAMS = {
+    'categories': (Category, 'updated_at', CategorySerializer),
+    'transactions': (Transaction, 'updated_at', TransactionSerializer),
+    'budgets': (Budget, 'updated_at', BudgetSerializer),
+}
+
+
+class InvalidWatermark(Exception):
+    pass
+
+
+class WatermarkExpired(InvalidWatermark):
+    pass
+
+
+def encode_watermark(cursors):
+    return signing.dumps(cursors, salt=SALT, compress=True)
+
+
+def decode_watermark(watermark):
+    try:
+        return signing.loads(watermark, salt=SALT)
+    except signing.BadSignature:
+        raise InvalidWatermark()
+
+
+def _page(queryset, field, cursor, limit, before):
+    queryset = queryset.filter(**{f'{field}__lt': before})
+    if cursor:
+        stamp, last_id = parse_datetime(cursor[0]), cursor[1]
+        queryset = queryset.filter(Q(**{f'{field}__gt': stamp}) | Q(**{field: stamp, 'id__gt': last_id}))
+    rows = list(queryset.order_by(field, 'id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        cursor = [getattr(rows[-1], field).isoformat(), rows[-1].id]
+    return rows, cursor, has_more
+
+
+def prune_tombstones():
+    cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    return Tombstone.objects.filter(deleted_at__lt=cutoff).delete()[0]
+
+
+def sync_page(request, watermark=None, limit=500):
+    user = request.user
+    now = timezone.now()
+    before = now - timedelta(seconds=settings.SYNC_SAFETY_MARGIN)
+    if watermark:
+        cursors = decode_watermark(watermark)
+        stamp = parse_datetime(cursors.get('tombstones', [''])[0] or '')
+        if stamp is None or stamp < now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS):
+            raise WatermarkExpired()
+    else:
+        # A full resync needs no past tombstones, only deletions that happen
+        # while the client is still paging through the snapshot.
+        cursors = {'tombstones': [before.isoformat(), 0]}
+
+    data = {}
+    has_more = False
+    context = {'request': request}
+
+    for name, (model, field, serializer_class) in STREAMS.items():
+        queryset = model.objects.filter(user=user)
+        if model is Transaction:
+            queryset = queryset.select_related('category')
+        rows, cursors[name], more = _page(queryset, field, cursors.get(name), limit, before)
+        data[name] = serializer_class(rows, many=True, context=context).data
+        has_more = has_more or more
+
+    tombstones, cursors['tombstones'], more = _page(
+        Tombstone.objects.filter(user=user), 'deleted_at', cursors.get('tombstones'), limit, before
+    )
+    if not more:
+        # Caught up: move the cursor to the safe point, so a client that
+        # syncs regularly never looks expired just because nothing was deleted.
+        cursors['tombstones'] = [before.isoformat(), 0]
+    has_more = has_more or more
+    deleted = {name: [] for name in STREAMS}
+    plural = {model._meta.model_name: name for name, (model, _, _) in STREAMS.items()}
+    for tombstone in tombstones:
+        deleted[plural[tombstone.model]].append(tombstone.object_id)
+
+    data['deleted'] = deleted
+    data['watermark'] = encode_watermark(cursors)
+    data['has_more'] = has_more
+    return data
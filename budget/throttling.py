@@ -0,0 +1,130 @@
+"""
+Rate limiting and load shedding.
+
+TokenBucketThrottle gives every client a bucket per route scope, holding up to
+N tokens and refilled continuously at N per period (RATE_LIMITS, e.g.
+'10/min'): bursts up to N pass, sustained traffic is held to the rate. A
+request needs a token from both its IP's and its user's bucket (for login, the
+username being tried), so neither rotating addresses nor accounts gets
+around it. The IP is the X-Forwarded-For entry added by the nearest trusted
+proxy (REST_FRAMEWORK['NUM_PROXIES']), so a client cannot pick its own.
+Buckets live in the 'state' cache; the read-modify-write is not
+atomic, so concurrent requests may occasionally share a token.
+
+concurrency_limit() caps how many requests of a kind run at once in this
+process and answers 503 with Retry-After beyond that, so expensive endpoints
+can never occupy every worker thread and cheap ones stay responsive.
+"""
+
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+from .cache import state_cache
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """'10/min' -> (capacity 10, refill rate in tokens per second); None disables."""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period.strip()[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+
+    def __init__(self):
+        self.delay = None
+
+    def get_idents(self, request):
+        idents = [f'ip:{self.get_ident(request)}']
+        if request.user and request.user.is_authenticated:
+            idents.append(f'user:{request.user.pk}')
+        return idents
+
+    def allow_request(self, request, view):
+        rate = parse_rate(settings.RATE_LIMITS.get(self.scope))
+        if rate is None:
+            return True
+        capacity, refill = rate
+
+        now = time.time()
+        keys = [f'budget:bucket:{self.scope}:{ident}' for ident in self.get_idents(request)]
+        stored = state_cache.get_many(keys)
+        buckets = {}
+        for key in keys:
+            tokens, updated = stored.get(key, (capacity, now))
+            buckets[key] = min(capacity, tokens + (now - updated) * refill)
+
+        empty = [tokens for tokens in buckets.values() if tokens < 1]
+        if empty:
+            self.delay = (1 - min(empty)) / refill
+            return False
+        # An untouched bucket is full again after capacity / refill seconds.
+        state_cache.set_many({key: (tokens - 1, now) for key, tokens in buckets.items()}, math.ceil(capacity / refill))
+        return True
+
+    def wait(self):
+        return self.delay
+
+
+class LoginThrottle(TokenBucketThrottle):
+    scope = 'login'
+
+    def get_idents(self, request):
+        idents = super().get_idents(request)
+        username = request.data.get('username')
+        if isinstance(username, str) and username:
+            idents.append(f'username:{username.lower()[:150]}')
+        return idents
+
+
+class DashboardThrottle(TokenBucketThrottle):
+    scope = 'dashboard'
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many requests in progress, try again shortly.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait):
+        super().__init__()
+        # Rendered as Retry-After by DRF's exception handler.
+        self.wait = wait
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def _semaphore(name):
+    with _semaphores_lock:
+        if name not in _semaphores:
+            _semaphores[name] = threading.BoundedSemaphore(settings.CONCURRENCY_LIMITS[name])
+        return _semaphores[name]
+
+
+def concurrency_limit(name):
+    """Run the view only if fewer than CONCURRENCY_LIMITS[name] such requests are in progress."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            semaphore = _semaphore(name)
+            if not semaphore.acquire(blocking=False):
+                raise Overloaded(settings.CONCURRENCY_RETRY_AFTER)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                semaphore.release()
+        return wrapper
+    return decorator
@@ -1,21 +1,87 @@
-from rest_framework import viewsets, status, filters
-from rest_framework.decorators import action, api_view, permission_classes
+import asyncio
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from rest_framework import mixins, viewsets, status, filters
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes, throttle_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.authentication import get_authorization_header
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db.models import Q, Sum
-from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from datetime import date, datetime, timedelta
 from decimal import Decimal
-from .models import Category, Transaction, Budget
+from .models import BalanceCheckpoint, Category, CategoryRule, RecurringTransaction, Transaction, Budget, Job, UserPreferences
+from django.utils.dateparse import parse_date
 from .serializers import (
-    CategorySerializer, TransactionSerializer, 
-    BudgetSerializer, DashboardSerializer, UserSerializer
+    CategorySerializer, CategoryRuleSerializer, CategoryStatsSerializer, TransactionSerializer, 
+    BudgetSerializer, BulkTransactionSerializer, DashboardSerializer, JobListSerializer, JobSerializer,
+    RecurringTransactionSerializer, UserPreferencesSerializer, UserSerializer
 )
+from .analytics import spending_analytics
+from .balance import MAX_HISTORY_MONTHS, balance_at, monthly_history
+from . import events, profiling, reports
+from .cache import EXPENSES, bump_version, cached_for_user
+from .compare import InvalidPeriod, compare_periods, parse_periods
+from .duplicates import BULK_LIMIT, create_many
+from .forecast import add_months, forecast_month
+from .fx import UnknownCurrency, base_currency, grouped_totals, raw_currency
+from .heatmap import MAX_YEAR, MIN_YEAR, BinaryRenderer, pack, year_heatmap
+from .recurring import MAX_RANGE_DAYS, default_range, materialize_due, scheduled_totals, upcoming
+from .rules import apply_rules
+from .stats import category_stats
+from .sync import InvalidWatermark, WatermarkExpired, sync_page
+from .throttling import DashboardThrottle, LoginThrottle, concurrency_limit
+
+
+def _date_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Enter a valid date (YYYY-MM-DD).'})
+    return parsed
+
+
+def _occurrence_range(request):
+    """?start_date= and ?end_date= for virtual occurrences: today and the next 30 days by default."""
+    start, end = default_range(_date_param(request, 'start_date'), _date_param(request, 'end_date'))
+    if start > end:
+        raise ValidationError({'start_date': 'start_date must not be after end_date.'})
+    if (end - start).days > MAX_RANGE_DAYS:
+        raise ValidationError({'end_date': f'The range may span at most {MAX_RANGE_DAYS} days.'})
+    return start, end
+
+
+def _target_category(request, field='target'):
+    """Resolve the target category from the request body, checking ownership once."""
+    target_id = request.data.get(field)
+    if not target_id:
+        raise ValidationError({field: 'This field is required.'})
+    try:
+        return Category.objects.get(pk=target_id, user=request.user)
+    except (Category.DoesNotExist, ValueError, TypeError):
+        raise ValidationError({field: 'Invalid category.'})
+
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginThrottle])
+@concurrency_limit('expensive')
 def login_view(request):
     username = request.data.get('username')
     password = request.data.get('password')
@@ -55,6 +121,18 @@ def current_user(request):
     return Response(serializer.data)
 
 
+@api_view(['GET', 'PATCH'])
+@permission_classes([IsAuthenticated])
+def preferences_view(request):
+    preferences = UserPreferences.objects.filter(user=request.user).first() or UserPreferences(user=request.user)
+    if request.method == 'PATCH':
+        serializer = UserPreferencesSerializer(preferences, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+    return Response(UserPreferencesSerializer(preferences).data)
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
@@ -68,6 +146,48 @@ class CategoryViewSet(viewsets.ModelViewSet):
         if category_type:
             queryset = queryset.filter(type=category_type)
         return queryset
+    
+    def with_stats(self):
+        return self.action in ('list', 'retrieve') and self.request.query_params.get('with_stats') in ('1', 'true', 'True')
+    
+    def get_serializer_class(self):
+        if self.with_stats():
+            return CategoryStatsSerializer
+        return CategorySerializer
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.with_stats():
+            # Optional date range, e.g. ?with_stats=1&start_date=2024-01-01&end_date=2024-03-31
+            context['currency'] = raw_currency(self.request.user)
+            context['stats'] = category_stats(
+                self.request.user,
+                _date_param(self.request, 'start_date'),
+                _date_param(self.request, 'end_date'),
+            )
+        return context
+    
+    @action(detail=True, methods=['post'])
+    def merge(self, request, pk=None):
+        """Move every transaction, recurring transaction and rule of this category into `target`, then delete this category."""
+        source = self.get_object()
+        target = _target_category(request)
+        if target.pk == source.pk:
+            raise ValidationError({'target': 'Cannot merge a category into itself.'})
+        if target.type != source.type:
+            raise ValidationError({'target': 'Categories must have the same type.'})
+        
+        with db_transaction.atomic():
+            moved = Transaction.objects.filter(user=request.user, category=source).update(
+                category=target, updated_at=timezone.now()
+            )
+            RecurringTransaction.objects.filter(user=request.user, category=source).update(category=target)
+            CategoryRule.objects.filter(user=request.user, category=source).update(category=target, updated_at=timezone.now())
+            source.delete()
+        bump_version(request.user.id)
+        bump_version(request.user.id, scope=EXPENSES)
+        
+        return Response({'moved': moved, 'target': CategorySerializer(target).data})
 
 
 class TransactionViewSet(viewsets.ModelViewSet):
@@ -78,7 +198,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
     ordering_fields = ['date', 'amount', 'created_at']
     
     def get_queryset(self):
-        queryset = Transaction.objects.filter(user=self.request.user)
+        queryset = Transaction.objects.filter(user=self.request.user).select_related('category')
         
         # Filter by type
         transaction_type = self.request.query_params.get('type', None)
@@ -89,7 +209,12 @@ class TransactionViewSet(viewsets.ModelViewSet):
         category_id = self.request.query_params.get('category', None)
         if category_id:
             queryset = queryset.filter(category_id=category_id)
-        
+
+        # Filter by currency
+        currency = self.request.query_params.get('currency', None)
+        if currency:
+            queryset = queryset.filter(currency=currency.upper())
+
         # Filter by date range
         start_date = self.request.query_params.get('start_date', None)
         end_date = self.request.query_params.get('end_date', None)
@@ -109,6 +234,113 @@ class TransactionViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(amount__lte=max_amount)
         
         return queryset
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('include_recurring') in ('1', 'true'):
+            # Occurrences of recurring transactions that are not transactions yet
+            start, end = _occurrence_range(request)
+            response.data['upcoming'] = upcoming(
+                request.user, start, end,
+                type=request.query_params.get('type'), category=request.query_params.get('category'),
+            )
+        return response
+    
+    @action(detail=False, methods=['post'])
+    def recategorize(self, request):
+        """
+        Move every transaction matching the list filters (query params) into the
+        `category` given in the body, as a single UPDATE. Matching transactions
+        of the other type stay where they are and are counted as `skipped`.
+        """
+        target = _target_category(request, 'category')
+        queryset = self.filter_queryset(self.get_queryset())
+        
+        with db_transaction.atomic():
+            skipped = queryset.exclude(type=target.type).count()
+            updated = queryset.filter(type=target.type).update(category=target, updated_at=timezone.now())
+            events.publish_refresh([request.user.id])
+            reports.mark_stale(request.user.id)
+        bump_version(request.user.id)
+        bump_version(request.user.id, scope=EXPENSES)
+        
+        return Response({'updated': updated, 'skipped': skipped})
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create up to 1000 transactions in one request: {"transactions": [...]}.
+        Rows duplicating a stored transaction (or an earlier row) are skipped
+        and reported, unless "allow_duplicates" is true.
+        """
+        rows = request.data.get('transactions') if isinstance(request.data, dict) else None
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({'transactions': 'Provide a non-empty list of transactions.'})
+        if len(rows) > BULK_LIMIT:
+            raise ValidationError({'transactions': f'At most {BULK_LIMIT} transactions per request.'})
+        
+        serializer = BulkTransactionSerializer(data=rows, many=True)
+        serializer.is_valid(raise_exception=True)
+        rows = serializer.validated_data
+        
+        category_ids = {row['category'] for row in rows if row.get('category') is not None}
+        owned = set(Category.objects.filter(user=request.user, id__in=category_ids).values_list('id', flat=True))
+        if category_ids - owned:
+            raise ValidationError({'category': f'Invalid category: {sorted(category_ids - owned)}'})
+        
+        try:
+            created, duplicates = create_many(request.user, rows, bool(request.data.get('allow_duplicates')))
+        except UnknownCurrency as exc:
+            raise ValidationError({'currency': str(exc)})
+        return Response(
+            {'created': [obj.pk for obj in created], 'duplicates': duplicates},
+            status=status.HTTP_201_CREATED
+        )
+
+
+class CategoryRuleViewSet(viewsets.ModelViewSet):
+    serializer_class = CategoryRuleSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return CategoryRule.objects.filter(user=self.request.user).select_related('category')
+    
+    @action(detail=False, methods=['post'])
+    def apply(self, request):
+        """Categorize every uncategorized transaction that matches a rule."""
+        return Response({'categorized': apply_rules(request.user)})
+
+
+class RecurringTransactionViewSet(viewsets.ModelViewSet):
+    """
+    Recurring transaction templates. Occurrences that are already due are
+    materialized as soon as a template is saved; later ones stay virtual.
+    """
+    serializer_class = RecurringTransactionSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return RecurringTransaction.objects.filter(user=self.request.user).select_related('category')
+    
+    def perform_create(self, serializer):
+        serializer.save()
+        materialize_due(users=[self.request.user])
+        serializer.instance.refresh_from_db()
+    
+    def perform_update(self, serializer):
+        serializer.save()
+        materialize_due(users=[self.request.user])
+        serializer.instance.refresh_from_db()
+    
+    @action(detail=False, methods=['get'])
+    def occurrences(self, request):
+        """Virtual occurrences between ?start_date= and ?end_date= (default the next 30 days)."""
+        start, end = _occurrence_range(request)
+        return Response({
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'occurrences': upcoming(request.user, start, end),
+        })
 
 
 class BudgetViewSet(viewsets.ModelViewSet):
@@ -136,31 +368,78 @@ class BudgetViewSet(viewsets.ModelViewSet):
             )
 
 
+class JobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                 mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Submit background jobs (reports, exports) and poll for their results."""
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        queryset = Job.objects.filter(user=self.request.user).filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
+        )
+        if self.action == 'list':
+            # Results (e.g. whole CSV exports) are only returned by retrieve.
+            queryset = queryset.defer('result')
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return JobListSerializer
+        return JobSerializer
+    
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([DashboardThrottle])
+@concurrency_limit('expensive')
 def dashboard_view(request):
     user = request.user
     now = datetime.now()
     
     # Get month and year from query params or use current
-    month = int(request.query_params.get('month', now.month))
-    year = int(request.query_params.get('year', now.year))
+    try:
+        month = int(request.query_params.get('month', now.month))
+        year = int(request.query_params.get('year', now.year))
+    except ValueError:
+        raise ValidationError({'detail': 'month and year must be integers.'})
+    if month < 1 or month > 12:
+        raise ValidationError({'month': 'Month must be between 1 and 12'})
+    if year < MIN_YEAR or year > MAX_YEAR:
+        raise ValidationError({'year': f'Must be between {MIN_YEAR} and {MAX_YEAR}.'})
     
-    # Calculate total income and expenses
+    # Totals and category breakdowns in the user's base currency
     transactions = Transaction.objects.filter(user=user)
-    total_income = transactions.filter(type='income').aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-    total_expenses = transactions.filter(type='expense').aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
+    base = base_currency(user)
+    by_category, currencies = grouped_totals(transactions, ['type', 'category__name'], base)
+    total_income = sum((t for (kind, _), t in by_category.items() if kind == 'income'), Decimal('0.00'))
+    total_expenses = sum((t for (kind, _), t in by_category.items() if kind == 'expense'), Decimal('0.00'))
     balance = total_income - total_expenses
     
+    # Monthly totals come from the balance checkpoints, which hold raw amounts:
+    # they are only usable as they are when every transaction is in the base currency
+    if currencies <= {base}:
+        months = {
+            (c.month.year, c.month.month): {'income': c.income, 'expenses': c.expenses}
+            for c in BalanceCheckpoint.objects.filter(user=user)
+        }
+    else:
+        by_month, _ = grouped_totals(transactions.annotate(period=TruncMonth('date')), ['period', 'type'], base)
+        months = defaultdict(lambda: {'income': Decimal('0.00'), 'expenses': Decimal('0.00')})
+        for (period, kind), total in by_month.items():
+            months[period.year, period.month]['income' if kind == 'income' else 'expenses'] += total
+    
     # Get current month budget
     try:
         budget = Budget.objects.get(user=user, month=month, year=year)
         monthly_budget = budget.amount
-        month_expenses = transactions.filter(
-            type='expense',
-            date__month=month,
-            date__year=year
-        ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
+        month_totals = months.get((year, month))
+        month_expenses = month_totals['expenses'] if month_totals else Decimal('0.00')
         
         budget_remaining = monthly_budget - month_expenses
         budget_percentage = float((month_expenses / monthly_budget * 100)) if monthly_budget > 0 else 0
@@ -169,45 +448,40 @@ def dashboard_view(request):
         budget_remaining = None
         budget_percentage = None
     
-    # Income by category
-    income_by_category = list(
-        transactions.filter(type='income', category__isnull=False)
-        .values('category__name')
-        .annotate(total=Sum('amount'))
-        .order_by('-total')
-    )
+    def category_totals(kind):
+        return sorted(
+            (
+                {'category__name': name, 'total': total}
+                for (row_kind, name), total in by_category.items() if row_kind == kind and name is not None
+            ),
+            key=lambda row: -row['total'],
+        )
     
-    # Expenses by category
-    expenses_by_category = list(
-        transactions.filter(type='expense', category__isnull=False)
-        .values('category__name')
-        .annotate(total=Sum('amount'))
-        .order_by('-total')
-    )
+    income_by_category = category_totals('income')
+    expenses_by_category = category_totals('expense')
     
     # Monthly trend for last 6 months
     monthly_trend = []
     for i in range(5, -1, -1):
         target_date = now - timedelta(days=30 * i)
-        month_income = transactions.filter(
-            type='income',
-            date__month=target_date.month,
-            date__year=target_date.year
-        ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-        
-        month_expense = transactions.filter(
-            type='expense',
-            date__month=target_date.month,
-            date__year=target_date.year
-        ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
+        month_totals = months.get((target_date.year, target_date.month))
         
         monthly_trend.append({
             'month': target_date.strftime('%b %Y'),
-            'income': float(month_income),
-            'expenses': float(month_expense)
+            'income': float(month_totals['income']) if month_totals else 0.0,
+            'expenses': float(month_totals['expenses']) if month_totals else 0.0
         })
     
+    # Recurring transactions still to come this month
+    month_start = date(year, month, 1)
+    month_end = date(*add_months(year, month, 1), 1) - timedelta(days=1)
+    scheduled = upcoming(user, month_start, month_end)
+    scheduled_by_category = scheduled_totals(user, month_start, month_end, base)
+    scheduled_income = sum((t for (kind, _), t in scheduled_by_category.items() if kind == 'income'), Decimal('0.00'))
+    scheduled_expenses = sum((t for (kind, _), t in scheduled_by_category.items() if kind == 'expense'), Decimal('0.00'))
+    
     data = {
+        'currency': base,
         'total_income': total_income,
         'total_expenses': total_expenses,
         'balance': balance,
@@ -216,13 +490,279 @@ def dashboard_view(request):
         'budget_percentage': budget_percentage,
         'income_by_category': income_by_category,
         'expenses_by_category': expenses_by_category,
-        'monthly_trend': monthly_trend
+        'monthly_trend': monthly_trend,
+        'scheduled_income': scheduled_income,
+        'scheduled_expenses': scheduled_expenses,
+        'upcoming': scheduled,
     }
     
     serializer = DashboardSerializer(data)
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([DashboardThrottle])
+@concurrency_limit('expensive')
+def dashboard_compare_view(request):
+    """
+    Income, expenses, budget and category totals for several periods side by
+    side, e.g. ?periods=2024-05,2024-04,2023-05 or 2024-Q1,2024-01-01..2024-01-15.
+    Deltas compare the first period with each of the others.
+    """
+    try:
+        periods = parse_periods(request.query_params.get('periods'))
+    except InvalidPeriod as exc:
+        raise ValidationError({'periods': str(exc)})
+    return Response(compare_periods(request.user, periods))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([DashboardThrottle])
+@concurrency_limit('expensive')
+def analytics_view(request):
+    """
+    Spending statistics the dashboard lacks: per-category distribution, rolling
+    7/30-day spend, day-of-week profile and outlier transactions.
+    """
+    end = _date_param(request, 'end_date') or date.today()
+    start = _date_param(request, 'start_date') or end - timedelta(days=364)
+    if start > end:
+        raise ValidationError({'start_date': 'start_date must not be after end_date.'})
+    if (end - start).days > 366 * 10:
+        raise ValidationError({'start_date': 'The range may span at most 10 years.'})
+    
+    transaction_type = request.query_params.get('type', 'expense')
+    if transaction_type not in ('income', 'expense'):
+        raise ValidationError({'type': "Must be 'income' or 'expense'."})
+    
+    outlier_method = request.query_params.get('outlier_method', 'zscore')
+    if outlier_method not in ('zscore', 'iqr'):
+        raise ValidationError({'outlier_method': "Must be 'zscore' or 'iqr'."})
+    
+    try:
+        threshold = float(request.query_params.get('threshold', 3.0 if outlier_method == 'zscore' else 1.5))
+        limit = min(max(int(request.query_params.get('limit', 20)), 0), 100)
+    except ValueError:
+        raise ValidationError({'detail': 'threshold and limit must be numbers.'})
+    
+    currency = raw_currency(request.user)
+    data = cached_for_user(
+        request.user.id, 'analytics',
+        [start, end, transaction_type, outlier_method, threshold, limit],
+        lambda: spending_analytics(request.user, start, end, transaction_type, outlier_method, threshold, limit),
+    )
+    return Response(dict(data, currency=currency))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def forecast_view(request):
+    """Projected month-end expenses per category versus the month's budget."""
+    now = datetime.now()
+    try:
+        month = int(request.query_params.get('month', now.month))
+        year = int(request.query_params.get('year', now.year))
+    except ValueError:
+        raise ValidationError({'detail': 'month and year must be integers.'})
+    if month < 1 or month > 12:
+        raise ValidationError({'month': 'Month must be between 1 and 12'})
+    # The history reaches HISTORY_MONTHS back, so year 1 would already fail.
+    if year < MIN_YEAR or year > MAX_YEAR:
+        raise ValidationError({'year': f'Must be between {MIN_YEAR} and {MAX_YEAR}.'})
+    
+    return Response(forecast_month(request.user, year, month))
+
+
+def _month_param(request, name, default):
+    value = request.query_params.get(name)
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise ValidationError({name: 'Enter a valid month (YYYY-MM).'})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def balance_view(request):
+    """Balance at the end of ?date= (default today)."""
+    day = _date_param(request, 'date') or date.today()
+    currency = raw_currency(request.user)
+    return Response({'date': day.isoformat(), 'currency': currency, 'balance': f'{balance_at(request.user, day):.2f}'})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def balance_history_view(request):
+    """Monthly income, expenses and closing balance from ?start= to ?end= (YYYY-MM)."""
+    end = _month_param(request, 'end', None) or date.today().replace(day=1)
+    start = _month_param(request, 'start', None)
+    for name, month in (('start', start), ('end', end)):
+        if month is not None and not MIN_YEAR <= month.year <= MAX_YEAR:
+            raise ValidationError({name: f'Year must be between {MIN_YEAR} and {MAX_YEAR}.'})
+    if start is None:
+        start = date(*add_months(end.year, end.month, -11), 1)
+    months = (end.year - start.year) * 12 + end.month - start.month + 1
+    if months < 1:
+        raise ValidationError({'start': 'start must not be after end.'})
+    if months > MAX_HISTORY_MONTHS:
+        raise ValidationError({'start': f'At most {MAX_HISTORY_MONTHS} months can be requested.'})
+    
+    currency = raw_currency(request.user)
+    history = [
+        {key: f'{value:.2f}' if key != 'month' else value for key, value in row.items()}
+        for row in monthly_history(request.user, start, end)
+    ]
+    return Response({'start': f'{start:%Y-%m}', 'end': f'{end:%Y-%m}', 'currency': currency, 'months': history})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + [BinaryRenderer])
+def heatmap_view(request):
+    """
+    Daily income and expense totals of ?year= (default this year) as parallel
+    arrays of cents, one entry per day from January 1st. With ?format=binary,
+    the same arrays packed as little-endian int64 (income, then expenses).
+    """
+    try:
+        year = int(request.query_params.get('year', date.today().year))
+    except ValueError:
+        raise ValidationError({'year': 'Must be an integer.'})
+    if year < MIN_YEAR or year > MAX_YEAR:
+        raise ValidationError({'year': f'Must be between {MIN_YEAR} and {MAX_YEAR}.'})
+    
+    currency = raw_currency(request.user)
+    data = year_heatmap(request.user, year)
+    if request.accepted_renderer.format == 'binary':
+        return Response(pack(data), headers={
+            'X-Heatmap-Year': str(year), 'X-Heatmap-Days': str(data['days']), 'X-Heatmap-Currency': currency,
+        })
+    return Response(dict(data, currency=currency))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def annual_report_view(request):
+    """
+    Year in review for ?year= (default this year): totals, savings rate, month
+    by month and category splits, budgets and the largest transactions.
+    """
+    try:
+        year = int(request.query_params.get('year', date.today().year))
+    except ValueError:
+        raise ValidationError({'year': 'Must be an integer.'})
+    if year < 1900 or year > date.today().year + 10:
+        raise ValidationError({'year': f'Must be between 1900 and {date.today().year + 10}.'})
+    
+    return Response(reports.annual_report(request.user, year))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_view(request):
+    """
+    Rows created, updated or deleted since `watermark`. Keep calling with the
+    returned watermark while `has_more` is true; omit it for a full resync.
+    """
+    try:
+        limit = min(max(int(request.query_params.get('limit', 500)), 1), 1000)
+    except ValueError:
+        raise ValidationError({'limit': 'Must be an integer.'})
+    
+    try:
+        data = sync_page(request, request.query_params.get('watermark'), limit)
+    except WatermarkExpired:
+        return Response(
+            {'watermark': 'Watermark too old, deletions since may be missed. Start a full resync by omitting it.'},
+            status=status.HTTP_410_GONE,
+        )
+    except InvalidWatermark:
+        raise ValidationError({'watermark': 'Invalid watermark. Start a full resync by omitting it.'})
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    """Stored request profiles, newest first."""
+    return Response(profiling.list_profiles())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_detail(request, profile_id):
+    """A profile with its SQL log; ?download=1 returns the raw profiler output."""
+    if request.query_params.get('download'):
+        path = profiling.profile_data_path(profile_id)
+        if path is None or not path.exists():
+            raise Http404
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+    
+    profile = profiling.load_profile(profile_id)
+    if profile is None:
+        raise Http404
+    return Response(profile)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def events_ticket_view(request):
+    """Short-lived ticket for ?ticket= on the event stream."""
+    return Response({'ticket': events.stream_ticket(request.user), 'expires_in': settings.EVENTS_TICKET_MAX_AGE})
+
+
+def _stream_user(request):
+    # EventSource cannot send headers, so it passes a short-lived ?ticket=;
+    # API tokens are only accepted in the Authorization header.
+    ticket = request.GET.get('ticket')
+    if ticket:
+        user_id = events.ticket_user_id(ticket)
+        return User.objects.filter(pk=user_id, is_active=True).first() if user_id else None
+    header = get_authorization_header(request).split()
+    if len(header) == 2 and header[0].lower() == b'token':
+        token = Token.objects.select_related('user').filter(key=header[1].decode()).first()
+        return token.user if token and token.user.is_active else None
+    user = request.user
+    return user if user.is_authenticated else None
+
+
+async def events_view(request):
+    """Server-sent event stream of the user's transaction and budget changes."""
+    if request.method != 'GET':
+        return JsonResponse({'detail': 'Method not allowed.'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for the lifetime of the stream.
+        return JsonResponse({'detail': 'The event stream is only served under ASGI.'}, status=501)
+    user = await sync_to_async(_stream_user)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    
+    async def stream():
+        subscription = events.broker.subscribe(user.id)
+        queue = subscription[1]
+        try:
+            yield f'retry: {settings.EVENTS_RETRY_MS}\n\n'
+            yield events.format_sse({'event': 'ready'})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield events.format_sse(event)
+        finally:
+            events.broker.unsubscribe(user.id, subscription)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # @api_view(['GET'])
 # @permission_classes([IsAuthenticated])
 # def current_month_budget(request):
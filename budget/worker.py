@@ -0,0 +1,19 @@
+"""
+Process pool entry points for ``manage.py run_jobs``.
+
+Worker processes are spawned fresh, so this module must not import models at
+load time: Django is set up by ``init`` before any job runs.
+"""
+
+import os
+
+
+def init():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'budget_tracker.settings')
+    import django
+    django.setup()
+
+
+def run(job_id):
+    from budget import jobs
+    return jobs.run(job_id)
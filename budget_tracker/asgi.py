@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'budget_tracker.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+application = get_asgi_application()
+
+from budget.events import cancel_on_disconnect  # noqa: E402 (needs the app registry)
+
+application = cancel_on_disconnect(application, paths={'/api/events/'})
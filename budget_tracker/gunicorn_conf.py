@@ -0,0 +1,62 @@
+"""
+Gunicorn configuration.
+
+    gunicorn -c python:budget_tracker.gunicorn_conf
+
+SERVER_MODE selects how the app is served:
+
+- ``gthread`` (default): the WSGI app on threaded sync workers.
+- ``asgi``: the ASGI app on uvicorn workers (needed for streaming endpoints).
+
+The Django app is preloaded and warmed up in the master, then shared by the
+forked workers copy-on-write. Workers are recycled after ``max_requests`` to
+bound memory growth. WEB_CONCURRENCY and WEB_THREADS override the CPU-based
+sizing. Several workers need a cache they all share (the default database
+cache); a per-process CACHE_BACKEND is refused unless WEB_CONCURRENCY=1.
+"""
+
+import multiprocessing
+import os
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'gthread')
+CPU_COUNT = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'budget_tracker.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    # One event loop per core; requests share the loop instead of threads.
+    workers = int(os.environ.get('WEB_CONCURRENCY', CPU_COUNT))
+elif SERVER_MODE == 'gthread':
+    wsgi_app = 'budget_tracker.wsgi:application'
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', CPU_COUNT + 1))
+    threads = int(os.environ.get('WEB_THREADS', 4))
+else:
+    raise RuntimeError(f"Unknown SERVER_MODE {SERVER_MODE!r}; use 'gthread' or 'asgi'")
+
+# Cache invalidation and rate limits only reach the process that handled a
+# request when the cache lives in process memory.
+if workers > 1 and 'locmem' in os.environ.get('CACHE_BACKEND', '').lower():
+    raise RuntimeError('CACHE_BACKEND is per-process; use a shared cache or set WEB_CONCURRENCY=1')
+
+preload_app = True
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    # Runs in the master after the app has been preloaded and before any
+    # worker is forked.
+    from budget_tracker.warmup import warm_up
+
+    warm_up()
+    server.log.info('Warm-up complete (%s mode, %s workers)', SERVER_MODE, workers)
+
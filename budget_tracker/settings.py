@@ -41,6 +41,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'budget.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'budget_tracker.urls'
@@ -153,4 +154,94 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # Reverse proxies in front of the app (one on Railway). Client IPs for rate
+    # limiting are read from the X-Forwarded-For entry the nearest proxy added;
+    # the entries before it are client-supplied and ignored.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
 }
+
+
+# Cache. The default database cache is shared by every worker process, so a
+# write invalidates cached results (and consumes rate-limit tokens) for all of
+# them; create its tables with `python manage.py createcachetable`. A per-process
+# backend such as LocMemCache is only correct with a single worker.
+# 'default' holds cached results, which are cheap to lose: past MAX_ENTRIES
+# expired rows are dropped, then 1/CULL_FREQUENCY of the rest. 'state' holds
+# the per-user version keys and rate-limit buckets, sized so that culling
+# (which would reset limits) does not happen in practice. The database
+# backend counts a table's rows on every set, so both stay bounded.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'budget_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 50000)),
+            'CULL_FREQUENCY': 4,
+        },
+    },
+    'state': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.environ.get('CACHE_STATE_LOCATION', 'budget_cache_state'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_STATE_MAX_ENTRIES', 200000)),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+BUDGET_CACHE_TIMEOUT = int(os.environ.get('BUDGET_CACHE_TIMEOUT', 60 * 60))
+
+# Currencies. Transactions without a currency, and users without a base
+# currency, use DEFAULT_CURRENCY. FX rates (manage.py load_fx_rates) are quoted
+# per unit of FX_REFERENCE_CURRENCY; a day without a rate uses the latest rate
+# at most FX_MAX_RATE_AGE_DAYS older (weekends, holidays).
+DEFAULT_CURRENCY = os.environ.get('DEFAULT_CURRENCY', 'USD')
+FX_REFERENCE_CURRENCY = os.environ.get('FX_REFERENCE_CURRENCY', 'EUR')
+FX_MAX_RATE_AGE_DAYS = int(os.environ.get('FX_MAX_RATE_AGE_DAYS', 7))
+
+# Token-bucket rate limits per route scope, per IP and per user ('N/s|min|hour|day';
+# empty disables). Buckets live in the 'state' cache above, so use a shared
+# backend to limit across processes.
+RATE_LIMITS = {
+    'login': os.environ.get('RATE_LIMIT_LOGIN', '10/min'),
+    'dashboard': os.environ.get('RATE_LIMIT_DASHBOARD', '120/min'),
+}
+
+# Expensive requests (login, dashboard, analytics) allowed in progress at once
+# per process; more are answered 503 with Retry-After, which keeps threads
+# free for cheap endpoints.
+CONCURRENCY_LIMITS = {
+    'expensive': int(os.environ.get('CONCURRENCY_LIMIT_EXPENSIVE', max(1, int(os.environ.get('WEB_THREADS', 4)) // 2))),
+}
+CONCURRENCY_RETRY_AFTER = int(os.environ.get('CONCURRENCY_RETRY_AFTER', 2))  # seconds
+
+# Background jobs (python manage.py run_jobs)
+JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', os.cpu_count() or 1))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))  # seconds, doubled on each retry
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 30 * 60))  # running jobs older than this are requeued
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 24 * 60 * 60))
+
+
+# On-demand profiling for staff (?profile=1 or X-Profile: 1)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_MAX_PROFILES = int(os.environ.get('PROFILING_MAX_PROFILES', 50))
+
+
+# Delta sync (/api/sync/). Rows saved in the last SYNC_SAFETY_MARGIN seconds
+# (longer than any write transaction) wait for the next sync; deletion
+# tombstones are pruned after SYNC_TOMBSTONE_RETENTION_DAYS, and clients with
+# an older watermark are told to resync in full.
+SYNC_SAFETY_MARGIN = int(os.environ.get('SYNC_SAFETY_MARGIN', 5))  # seconds
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+
+
+# Live change events (/api/events/, ASGI only). 'memory' fans out within one
+# process; 'postgres' uses LISTEN/NOTIFY so every process sees every write.
+EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'memory')
+EVENTS_CHANNEL = os.environ.get('EVENTS_CHANNEL', 'budget_events')
+EVENTS_KEEPALIVE = int(os.environ.get('EVENTS_KEEPALIVE', 15))  # seconds
+EVENTS_RETRY_MS = int(os.environ.get('EVENTS_RETRY_MS', 5000))
+EVENTS_TICKET_MAX_AGE = int(os.environ.get('EVENTS_TICKET_MAX_AGE', 60))  # seconds
@@ -8,6 +8,9 @@ router = DefaultRouter()
 router.register(r'categories', views.CategoryViewSet, basename='category')
 router.register(r'transactions', views.TransactionViewSet, basename='transaction')
 router.register(r'budgets', views.BudgetViewSet, basename='budget')
+router.register(r'rules', views.CategoryRuleViewSet, basename='rule')
+router.register(r'recurring', views.RecurringTransactionViewSet, basename='recurring')
+router.register(r'jobs', views.JobViewSet, basename='job')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -15,6 +18,19 @@ urlpatterns = [
     path('api/auth/login/', views.login_view, name='login'),
     path('api/auth/logout/', views.logout_view, name='logout'),
     path('api/auth/user/', views.current_user, name='current-user'),
+    path('api/auth/preferences/', views.preferences_view, name='preferences'),
     path('api/dashboard/', views.dashboard_view, name='dashboard'),
+    path('api/dashboard/compare/', views.dashboard_compare_view, name='dashboard-compare'),
+    path('api/analytics/', views.analytics_view, name='analytics'),
+    path('api/forecast/', views.forecast_view, name='forecast'),
+    path('api/balance/', views.balance_view, name='balance'),
+    path('api/balance/history/', views.balance_history_view, name='balance-history'),
+    path('api/heatmap/', views.heatmap_view, name='heatmap'),
+    path('api/reports/annual/', views.annual_report_view, name='annual-report'),
+    path('api/sync/', views.sync_view, name='sync'),
+    path('api/events/', views.events_view, name='events'),
+    path('api/events/ticket/', views.events_ticket_view, name='events-ticket'),
+    path('api/profiles/', views.profile_list, name='profile-list'),
+    path('api/profiles/<str:profile_id>/', views.profile_detail, name='profile-detail'),
     # path('api/budgets/current-month/', views.current_month_budget, name='budget-current-month'),
 ]
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""
+Warm-up run in the gunicorn master after the app is preloaded, so each forked
+worker starts with URL resolvers, serializer field maps and model metadata
+already built instead of paying for them on its first requests.
+"""
+
+from django.db import connections
+from django.urls import get_resolver
+from rest_framework import serializers
+
+
+def warm_urls():
+    resolver = get_resolver()
+    # Touching reverse_dict populates the resolver's lookup tables for all
+    # included URLconfs (admin, router, api views).
+    resolver.reverse_dict
+    for path in ('/api/', '/api/dashboard/', '/api/transactions/'):
+        resolver.resolve(path)
+
+
+def warm_serializers():
+    from budget import serializers as budget_serializers
+
+    for value in vars(budget_serializers).values():
+        if isinstance(value, type) and issubclass(value, serializers.Serializer) and value.__module__ == budget_serializers.__name__:
+            value().fields
+
+
+def check_databases(close=True):
+    """Fail fast if a database is unreachable, then drop the connection before forking."""
+    for connection in connections.all():
+        connection.ensure_connection()
+        if close:
+            connection.close()
+
+
+def warm_up(close_connections=True):
+    warm_urls()
+    warm_serializers()
+    check_databases(close_connections)
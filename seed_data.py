@@ -10,7 +10,8 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "budget_tracker.settings")
 django.setup()
 
 from django.contrib.auth.models import User
-from budget.models import Category, Transaction, Budget
+from budget.models import Category, RecurringTransaction, Transaction, Budget
+from budget.recurring import materialize_due
 from decimal import Decimal
 from datetime import datetime, timedelta
 import random
@@ -33,6 +34,7 @@ except User.DoesNotExist:
 # Clear existing data for demo user
 Category.objects.filter(user=demo_user).delete()
 Transaction.objects.filter(user=demo_user).delete()
+RecurringTransaction.objects.filter(user=demo_user).delete()
 Budget.objects.filter(user=demo_user).delete()
 
 # Create Income Categories
@@ -62,22 +64,32 @@ print(f"Created {len(expense_categories)} expense categories")
 today = datetime.now().date()
 transactions_created = 0
 
-# Monthly Income Transactions
+# Salary and the internet bill recur monthly; their past occurrences are
+# materialized below and later ones stay virtual
+RecurringTransaction.objects.create(
+    user=demo_user,
+    category=income_categories[0],
+    type='income',
+    amount=Decimal('50000.00'),
+    frequency='monthly',
+    start_date=(today - timedelta(days=30 * 5)).replace(day=1),
+    description='Monthly salary credit'
+)
+RecurringTransaction.objects.create(
+    user=demo_user,
+    category=expense_categories[3],
+    type='expense',
+    amount=Decimal('999.00'),
+    frequency='monthly',
+    start_date=(today - timedelta(days=30 * 5)).replace(day=5),
+    description='Internet bill'
+)
+transactions_created += materialize_due(users=[demo_user])[0]
+
+# Occasional freelance income over the last 6 months
 for i in range(6):
     month_date = today - timedelta(days=30 * i)
     
-    # Salary (monthly)
-    Transaction.objects.create(
-        user=demo_user,
-        category=income_categories[0],
-        type='income',
-        amount=Decimal('50000.00'),
-        date=month_date.replace(day=1),
-        description='Monthly salary credit'
-    )
-    transactions_created += 1
-    
-    # Occasional freelance income
     if random.choice([True, False]):
         Transaction.objects.create(
             user=demo_user,